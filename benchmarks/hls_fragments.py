@@ -0,0 +1,92 @@
+"""
+HLS fragment concurrency benchmark
+
+Serves a local HLS stream whose segments each take --latency seconds to
+start, then downloads it with yt-dlp at several
+concurrent_fragment_downloads values and reports the throughput.
+
+    python benchmarks/hls_fragments.py --segments 60 --latency 0.1 --concurrency 1 4 8
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from aiohttp import web
+from yt_dlp import YoutubeDL
+
+
+def make_app(segments: int, segment_size: int, latency: float) -> web.Application:
+    payload = os.urandom(segment_size)
+
+    async def playlist(request):
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(segments):
+            lines += ['#EXTINF:2.0,', f'seg{i}.ts']
+        lines.append('#EXT-X-ENDLIST')
+        return web.Response(text='\n'.join(lines) + '\n', content_type='application/vnd.apple.mpegurl')
+
+    async def segment(request):
+        # Simulated round trip to a distant CDN
+        await asyncio.sleep(latency)
+        return web.Response(body=payload, content_type='video/mp2t')
+
+    app = web.Application()
+    app.router.add_get('/stream.m3u8', playlist)
+    app.router.add_get('/seg{index}.ts', segment)
+    return app
+
+
+def download(url: str, concurrency: int, directory: str) -> tuple[float, int]:
+    opts = {
+        'outtmpl': os.path.join(directory, f'c{concurrency}.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'concurrent_fragment_downloads': concurrency,
+        'buffersize': 1024 * 1024,
+    }
+    started = time.perf_counter()
+    with YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        filename = ydl.prepare_filename(info)
+    elapsed = time.perf_counter() - started
+
+    size = os.path.getsize(filename)
+    os.remove(filename)
+    return elapsed, size
+
+
+async def main(args):
+    runner = web.AppRunner(make_app(args.segments, args.segment_size, args.latency))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+
+    url = f'http://127.0.0.1:{args.port}/stream.m3u8'
+    loop = asyncio.get_running_loop()
+    print(f"{args.segments} segments x {args.segment_size // 1024} KB, {args.latency * 1000:.0f} ms latency")
+
+    baseline = None
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for concurrency in args.concurrency:
+                elapsed, size = await loop.run_in_executor(None, download, url, concurrency, directory)
+                throughput = size / elapsed / 1024 / 1024
+                baseline = baseline or throughput
+                print(
+                    f"concurrency {concurrency:>3}: {elapsed:6.2f}s "
+                    f"{throughput:8.2f} MB/s  x{throughput / baseline:.2f}"
+                )
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=60)
+    parser.add_argument('--segment-size', type=int, default=256 * 1024)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds before each segment is served')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--port', type=int, default=8799)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+"""
+Upload part reading benchmark
+
+Cuts a file into 512KB upload parts the way UploaderService did before
+(aiofiles reads re-split through a bytearray) and with the sources in
+src/services/upload_source.py, then serializes each part into a
+SaveBigFilePartRequest like Telethon does before encrypting it.
+
+Reports wall time (untraced run) and, under tracemalloc, the most and
+the average memory allocated while producing and serializing one part.
+The page cache is warm, so cold disk reads (where pread in an executor
+keeps the event loop free and mmap page faults don't) aren't measured.
+
+    python benchmarks/upload_parts.py --size 256
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import aiofiles
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.services.upload_source import FileSource, MmapFileSource  # noqa: E402
+
+PART_SIZE = 512 * 1024
+
+
+async def old_parts(path: str):
+    """Previous path: aiofiles chunks re-split through a bytearray"""
+    async def read_chunks():
+        async with aiofiles.open(path, 'rb') as f:
+            while chunk := await f.read(PART_SIZE):
+                yield chunk
+
+    buffer = bytearray()
+    async for chunk in read_chunks():
+        buffer += chunk
+        while len(buffer) >= PART_SIZE:
+            yield bytes(buffer[:PART_SIZE])
+            del buffer[:PART_SIZE]
+    if buffer:
+        yield bytes(buffer)
+
+
+VARIANTS = {
+    'aiofiles+bytearray': old_parts,
+    'mmap slices': lambda path: MmapFileSource(path, PART_SIZE).parts(),
+    'pread': lambda path: FileSource(path, PART_SIZE).parts(),
+}
+
+
+async def run(parts, serialize: bool, traced: bool) -> tuple[int, int, int]:
+    """Consume parts, returns (count, summed and highest per-part allocation peaks)"""
+    count = allocated = highest = 0
+    part_count = None
+    if traced:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    async for part in parts:
+        if serialize:
+            part_count = part_count or 0x7fffffff
+            bytes(SaveBigFilePartRequest(1, count, part_count, part))
+        count += 1
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1] - base
+            allocated += peak
+            highest = max(highest, peak)
+            del part
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+    return count, allocated, highest
+
+
+def main(args):
+    with tempfile.NamedTemporaryFile(dir=args.dir, delete=False) as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size):
+            f.write(block)
+        path = f.name
+
+    try:
+        print(f"{args.size} MB file, {PART_SIZE // 1024} KB parts, serialize={not args.no_serialize}\n")
+        print(f"{'source':>20} {'time':>8} {'MB/s':>8} {'max/part':>10} {'alloc/part':>12}")
+        for name, variant in VARIANTS.items():
+            started = time.perf_counter()
+            asyncio.run(run(variant(path), not args.no_serialize, traced=False))
+            elapsed = time.perf_counter() - started
+
+            tracemalloc.start()
+            count, allocated, peak = asyncio.run(run(variant(path), not args.no_serialize, traced=True))
+            tracemalloc.stop()
+
+            print(
+                f"{name:>20} {elapsed:7.2f}s {args.size / elapsed:8.0f} "
+                f"{peak / 1024:8.0f}KB {allocated / count / 1024:10.0f}KB"
+            )
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=256, help="file size in MB")
+    parser.add_argument('--dir', default=None, help="where to write the test file")
+    parser.add_argument('--no-serialize', action='store_true', help="skip SaveBigFilePartRequest serialization")
+    main(parser.parse_args())
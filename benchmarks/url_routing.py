@@ -0,0 +1,102 @@
+"""
+URL routing micro-benchmark
+
+Times the domain-suffix trie in src/utils/url_router.py against the
+substring scans it replaced (is_platform_url, YtDlpService._detect_platform,
+DownloaderService._is_video_site/_is_direct_link), and lists URLs the two
+classify differently.
+
+    python benchmarks/url_routing.py --number 20000
+"""
+import argparse
+import os
+import sys
+import timeit
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.utils.url_router import UrlRouter  # noqa: E402
+
+
+# Previous implementations, kept here for comparison
+OLD_PLATFORMS = [
+    'youtube.com', 'youtu.be', 'spotify.com', 'deezer.com',
+    'soundcloud.com', 'pornhub.com', 'xvideos.com', 'xnxx.com'
+]
+OLD_DETECT = [
+    ('youtube.com', 'youtube'), ('youtu.be', 'youtube'), ('spotify.com', 'spotify'),
+    ('deezer.com', 'deezer'), ('soundcloud.com', 'soundcloud'), ('pornhub.com', 'pornhub'),
+    ('xvideos.com', 'xvideos'), ('xnxx.com', 'xnxx'),
+]
+OLD_VIDEO_SITES = [
+    'youtube.com', 'youtu.be', 'pornhub.com', 'pornhub.org', 'pornhub.net', 'de.pornhub.org',
+    'xvideos.com', 'xnxx.com', 'twitter.com', 'x.com', 'instagram.com', 'tiktok.com',
+    'reddit.com', 'vimeo.com', 'dailymotion.com', 'facebook.com', 'fb.watch', 'twitch.tv',
+    'streamable.com',
+]
+OLD_EXTENSIONS = [
+    '.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.wmv', '.mp3', '.m4a', '.wav', '.flac',
+    '.ogg', '.aac', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.pdf', '.zip', '.rar',
+    '.7z', '.tar', '.gz',
+]
+
+
+def old_route(url: str) -> tuple[str, str | None]:
+    url_lower = url.lower()
+    if any(platform in url_lower for platform in OLD_PLATFORMS):
+        platform = next((name for domain, name in OLD_DETECT if domain in url_lower), None)
+        return 'platform', platform
+
+    domain = urlparse(url).netloc.lower().replace('www.', '')
+    if any(site in domain for site in OLD_VIDEO_SITES):
+        return 'video', None
+
+    path = urlparse(url).path.lower()
+    if any(path.endswith(ext) for ext in OLD_EXTENSIONS):
+        return 'direct', None
+    return 'unknown', None
+
+
+URLS = [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ?si=abc',
+    'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC',
+    'https://soundcloud.com/artist/track',
+    'https://de.pornhub.org/view_video.php?viewkey=abc',
+    'https://x.com/user/status/123',
+    'https://www.instagram.com/reel/abc/',
+    'https://vimeo.com/123456',
+    'https://cdn.example.com/files/video.mp4',
+    'https://files.example.org/archive.tar.gz?token=abc',
+    'https://example.com/download?file=report.pdf',
+    'https://example.com/redirect?to=https://youtube.com/watch?v=x',
+    'https://notyoutube.com/watch',
+    'https://box.com/file.mp4',
+    'https://example.com/page',
+]
+
+
+def main(args):
+    router = UrlRouter()
+
+    def new_route(url):
+        route = router.route(url)
+        return route.engine, route.platform
+
+    for name, func in (('substring scans', old_route), ('suffix trie', new_route)):
+        elapsed = timeit.timeit(lambda: [func(url) for url in URLS], number=args.number)
+        per_url = elapsed / (args.number * len(URLS)) * 1e9
+        print(f"{name:>16}: {per_url:8.0f} ns/url")
+
+    print("\nDifferent routes (old -> new):")
+    for url in URLS:
+        old, new = old_route(url), new_route(url)
+        if old != new:
+            print(f"  {url}\n    {old} -> {new}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000)
+    main(parser.parse_args())
@@ -7,6 +7,7 @@ class Config:
     # Server
     PORT = int(os.getenv('PORT', 8080))
     BACKEND_SECRET = os.getenv('BACKEND_SECRET')
+    WORKERS = int(os.getenv('WORKERS', 1))  # uvicorn worker processes
     
     # Telegram
     TELEGRAM_API_ID = int(os.getenv('TELEGRAM_API_ID'))
@@ -14,16 +15,129 @@ class Config:
     BOT_TOKEN = os.getenv('BOT_TOKEN')
     BACKUP_CHANNEL_ID = int(os.getenv('BACKUP_CHANNEL_ID'))
     
+    # Extra bots that share uploads to the backup channel (comma separated)
+    BOT_TOKENS = [t.strip() for t in os.getenv('BOT_TOKENS', '').split(',') if t.strip()]
+    BOT_FAILURE_COOLDOWN = int(os.getenv('BOT_FAILURE_COOLDOWN', 60))  # Rest a bot after repeated failures
+    
     # Limits
     MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 2147483648))  # 2GB
     
+    # Job queue
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 8))
+    JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 1000))
+    JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 3600))  # Keep finished jobs for 1 hour
+    JOB_JOURNAL_DB = os.getenv('JOB_JOURNAL_DB', '/app/sessions/jobs.db')  # Unfinished jobs, replayed on startup
+    JOB_REPLAY_MAX = int(os.getenv('JOB_REPLAY_MAX', 3))  # Give up on a job that keeps dying with the process
+    DIRECT_CONCURRENCY = int(os.getenv('DIRECT_CONCURRENCY', 4))
+    YTDLP_CONCURRENCY = int(os.getenv('YTDLP_CONCURRENCY', 2))
+    UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 3))
+    
+    # Queue backend: memory (per process) or redis (shared by workers and nodes)
+    QUEUE_BACKEND = os.getenv('QUEUE_BACKEND', 'memory').lower()
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    QUEUE_PREFIX = os.getenv('QUEUE_PREFIX', 'downloader')
+    
+    # yt-dlp worker processes (pool size is YTDLP_CONCURRENCY)
+    YTDLP_TIMEOUT = int(os.getenv('YTDLP_TIMEOUT', 1800))  # 30 minutes per job
+    YTDLP_WORKER_MAX_JOBS = int(os.getenv('YTDLP_WORKER_MAX_JOBS', 50))
+    
+    # yt-dlp HLS/DASH fetching (platform configs may override)
+    YTDLP_FRAGMENT_CONCURRENCY = int(os.getenv('YTDLP_FRAGMENT_CONCURRENCY', 4))
+    YTDLP_BUFFER_SIZE = int(os.getenv('YTDLP_BUFFER_SIZE', 1024 * 1024))  # 1MB
+    YTDLP_HTTP_CHUNK_SIZE = int(os.getenv('YTDLP_HTTP_CHUNK_SIZE', 10 * 1024 * 1024))  # 10MB
+    YTDLP_EXTERNAL_DOWNLOADER = os.getenv('YTDLP_EXTERNAL_DOWNLOADER', '')  # e.g. aria2c, empty = built-in
+    YTDLP_EXTERNAL_CONNECTIONS = int(os.getenv('YTDLP_EXTERNAL_CONNECTIONS', 8))
+    
+    # ffmpeg postprocessing (merges, audio extraction)
+    FFMPEG_THREADS = int(os.getenv('FFMPEG_THREADS', 2))
+    FFMPEG_CONCURRENCY = int(os.getenv('FFMPEG_CONCURRENCY', 2))  # Across all yt-dlp workers
+    
+    # Segmented direct downloads
+    DOWNLOAD_SEGMENTS = int(os.getenv('DOWNLOAD_SEGMENTS', 8))
+    SEGMENT_MIN_SIZE = int(os.getenv('SEGMENT_MIN_SIZE', 8 * 1024 * 1024))  # 8MB
+    SEGMENT_RETRIES = int(os.getenv('SEGMENT_RETRIES', 3))
+    
+    # Retries (exponential backoff, resumes partial downloads)
+    DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 4))
+    RETRY_BACKOFF = float(os.getenv('RETRY_BACKOFF', 2))
+    RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', 60))
+    
+    # Stream direct links straight to Telegram without staging on disk
+    STREAM_UPLOAD = os.getenv('STREAM_UPLOAD', 'true').lower() == 'true'
+    STREAM_BUFFER_PARTS = int(os.getenv('STREAM_BUFFER_PARTS', 16))  # x 512KB parts
+    
+    # Per-host connection limits (halved on 429/503, grow back on success)
+    HOST_CONCURRENCY = int(os.getenv('HOST_CONCURRENCY', 16))
+    HOST_MIN_CONCURRENCY = int(os.getenv('HOST_MIN_CONCURRENCY', 1))
+    HOST_THROTTLE_DELAY = float(os.getenv('HOST_THROTTLE_DELAY', 5))  # Pause after 429 without Retry-After
+    HOST_RETRY_AFTER_MAX = float(os.getenv('HOST_RETRY_AFTER_MAX', 300))
+    HOST_PARKED_MAX = int(os.getenv('HOST_PARKED_MAX', 200))  # Jobs held back for busy hosts
+    
+    # Fair scheduling: weighted fair queuing per user plus a fast lane for small files
+    SCHEDULER_LOOKAHEAD = int(os.getenv('SCHEDULER_LOOKAHEAD', 100))  # Queued jobs to choose from (per process)
+    SCHEDULER_SHARED_MARGIN = int(os.getenv('SCHEDULER_SHARED_MARGIN', 2))  # Shared queues: jobs taken beyond free workers
+    SMALL_JOB_SIZE = int(os.getenv('SMALL_JOB_SIZE', 50 * 1024 * 1024))  # Fast lane up to this size
+    FAST_LANE_WORKERS = int(os.getenv('FAST_LANE_WORKERS', 2))  # Job workers only small jobs may use
+    DEFAULT_JOB_SIZE = int(os.getenv('DEFAULT_JOB_SIZE', 200 * 1024 * 1024))  # Assumed when the size is unknown
+    # Premium users get a bigger share: "userId:weight,..." (default weight 1)
+    USER_WEIGHTS = {
+        int(user): float(weight)
+        for user, weight in (
+            item.split(':') for item in os.getenv('USER_WEIGHTS', '').split(',') if item.strip()
+        )
+    }
+    SIZE_PROBE_CONCURRENCY = int(os.getenv('SIZE_PROBE_CONCURRENCY', 4))
+    SIZE_PROBE_TIMEOUT = float(os.getenv('SIZE_PROBE_TIMEOUT', 15))
+    SIZE_PROBE_YTDLP = os.getenv('SIZE_PROBE_YTDLP', 'true').lower() == 'true'  # Extract info early (cached for the download)
+    
+    # Parallel MTProto connections per upload
+    UPLOAD_CONNECTIONS = int(os.getenv('UPLOAD_CONNECTIONS', 4))
+    
     # Paths
     DOWNLOAD_DIR = '/tmp/downloads'
     SESSION_DIR = '/app/sessions'
     COOKIE_FILE = os.getenv('COOKIE_FILE', '/app/cookies.txt')
+    CACHE_DB = os.getenv('CACHE_DB', '/app/sessions/file_cache.db')
+    
+    # Temp storage (DOWNLOAD_DIR) admission and cleanup
+    STORAGE_QUOTA = int(os.getenv('STORAGE_QUOTA', 0))  # Per host, 0 = what the disk can take
+    STORAGE_MIN_FREE = int(os.getenv('STORAGE_MIN_FREE', 1024 * 1024 * 1024))  # 1GB
+    STORAGE_DEFAULT_RESERVE = int(os.getenv('STORAGE_DEFAULT_RESERVE', 512 * 1024 * 1024))  # Unknown sizes
+    STORAGE_ORPHAN_AGE = int(os.getenv('STORAGE_ORPHAN_AGE', 2 * 3600))
+    STORAGE_PARTIAL_AGE = int(os.getenv('STORAGE_PARTIAL_AGE', 24 * 3600))  # Resumable .part files
+    STORAGE_SWEEP_INTERVAL = int(os.getenv('STORAGE_SWEEP_INTERVAL', 600))
+    STORAGE_USAGE_INTERVAL = int(os.getenv('STORAGE_USAGE_INTERVAL', 5))  # Download dir size refresh
+    
+    # Dedup cache
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 7 * 24 * 3600))  # 7 days
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 50000))
+    
+    # yt-dlp info cache (in memory, backed by CACHE_DB)
+    INFO_CACHE_TTL = int(os.getenv('INFO_CACHE_TTL', 1800))  # Platforms without own TTL
+    INFO_CACHE_SIZE = int(os.getenv('INFO_CACHE_SIZE', 128))
+    
+    # Status message edits (Telegram rate limits)
+    STATUS_CHAT_RATE = float(os.getenv('STATUS_CHAT_RATE', 0.5))  # Edits per second per chat
+    STATUS_CHAT_BURST = float(os.getenv('STATUS_CHAT_BURST', 2))
+    STATUS_GLOBAL_RATE = float(os.getenv('STATUS_GLOBAL_RATE', 20))  # Edits per second overall
+    
+    # HTTP connection pools
+    HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+    HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', 32))
+    HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', 300))
+    HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', 30))
     
     # Proxy
     PROXY_LIST = [p.strip() for p in os.getenv('PROXY_LIST', '').split(',') if p.strip()]
+    PROXY_FAILURE_THRESHOLD = int(os.getenv('PROXY_FAILURE_THRESHOLD', 3))  # Failures in a row before cooldown
+    PROXY_COOLDOWN = float(os.getenv('PROXY_COOLDOWN', 60))  # Doubles on each trip in a row
+    PROXY_COOLDOWN_MAX = float(os.getenv('PROXY_COOLDOWN_MAX', 1800))
+    PROXY_BAN_COOLDOWN = float(os.getenv('PROXY_BAN_COOLDOWN', 900))  # Proxy benched for one domain after 403/429
+    PROXY_EXPLORE = float(os.getenv('PROXY_EXPLORE', 0.1))  # Share of requests sent to a random healthy proxy
+    PROXY_DOMAIN_STATS = int(os.getenv('PROXY_DOMAIN_STATS', 1000))  # Domains tracked per proxy
+    PROXY_PROBE_URL = os.getenv('PROXY_PROBE_URL', 'https://www.gstatic.com/generate_204')
+    PROXY_PROBE_INTERVAL = int(os.getenv('PROXY_PROBE_INTERVAL', 60))
+    PROXY_PROBE_TIMEOUT = float(os.getenv('PROXY_PROBE_TIMEOUT', 10))
     
     # User agents
     USER_AGENTS = [
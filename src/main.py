@@ -1,10 +1,19 @@
 from fastapi import FastAPI, HTTPException, Header, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 from contextlib import asynccontextmanager
 from datetime import datetime
 from src.config import config
 from src.routes.download import router as download_router
 from src.services.uploader import uploader
+from src.services.jobs import job_manager
+from src.services.http import http_sessions
+from src.services.proxy_pool import proxy_pool
+from src.services.status import status_updates
+from src.services.ytdlp_pool import ytdlp_pool
+from src.services.storage import storage_manager
+from src.services.pipeline import process_job, recover_jobs
+from src.services import metrics as prometheus_metrics
 from src.utils.logger import logger
 from src.utils.helpers import ensure_dir
 
@@ -16,15 +25,36 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Telegram Downloader Backend")
     logger.info("=" * 50)
     
+    if config.WORKERS > 1 and not prometheus_metrics.MULTIPROC_DIR:
+        raise RuntimeError("WORKERS > 1 needs PROMETHEUS_MULTIPROC_DIR, /metrics would only show one worker")
+    
     # Ensure directories exist
     await ensure_dir(config.DOWNLOAD_DIR)
     await ensure_dir(config.SESSION_DIR)
     logger.info(f"Download dir: {config.DOWNLOAD_DIR}")
     logger.info(f"Session dir: {config.SESSION_DIR}")
     
+    # Temp storage admission, sweeps files left by crashed jobs
+    await storage_manager.start()
+    
+    # Shared HTTP connection pools
+    await http_sessions.start()
+    
+    # Proxy health probes
+    await proxy_pool.start()
+    
     # Start Telethon
     await uploader.start()
     
+    # Status message edits
+    await status_updates.start()
+    
+    # Start job workers
+    await job_manager.start(process_job)
+    
+    # Replay jobs a restart or crash interrupted
+    await recover_jobs()
+    
     logger.info(f"Server ready on port {config.PORT}")
     logger.info("=" * 50)
     
@@ -32,7 +62,14 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down...")
+    await job_manager.stop()
+    await ytdlp_pool.stop()
+    await status_updates.stop()
     await uploader.stop()
+    await proxy_pool.stop()
+    await http_sessions.stop()
+    await storage_manager.stop()
+    prometheus_metrics.mark_process_dead()
     logger.info("Bye!")
 
 app = FastAPI(
@@ -73,6 +110,12 @@ async def ping():
     """Ping endpoint"""
     return {"pong": int(datetime.now().timestamp())}
 
+# Prometheus metrics
+@app.get("/metrics", dependencies=[Depends(verify_token)])
+async def metrics():
+    """Prometheus metrics"""
+    return Response(prometheus_metrics.render(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
 # Root
 @app.get("/")
 async def root():
@@ -92,6 +135,14 @@ async def api_info():
         "version": "1.0.0",
         "endpoints": {
             "download": "/api/download (POST)",
+            "info": "/api/info (POST)",
+            "job": "/api/jobs/{id} (GET)",
+            "queue": "/api/jobs (GET)",
+            "cache": "/api/cache (GET)",
+            "http": "/api/http (GET)",
+            "storage": "/api/storage (GET)",
+            "proxies": "/api/proxies (GET)",
+            "metrics": "/metrics (GET)",
             "health": "/health (GET)",
             "ping": "/ping (GET)"
         }
@@ -128,13 +179,23 @@ async def not_found_handler(request, exc):
     )
 
 if __name__ == "__main__":
+    import os
+    import shutil
     import uvicorn
     
+    if config.WORKERS > 1 and not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # Workers import prometheus_client with this set and share the directory
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = '/tmp/prometheus'
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # Files of a previous run would be merged in
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+        os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+    
     uvicorn.run(
         "src.main:app",
         host="0.0.0.0",
         port=config.PORT,
-        workers=1,
+        workers=config.WORKERS,
         log_level="info",
         access_log=True
     )
\ No newline at end of file
@@ -1,13 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from src.services.downloader import DownloaderService
-from src.services.ytdlp import YtDlpService
+from src.services.jobs import Job, QueueFullError, job_manager
+from src.services.cache import file_cache
+from src.services.info_cache import info_cache
+from src.services.coalescer import coalescer
+from src.services.http import http_sessions
+from src.services.proxy_pool import proxy_pool
+from src.services.host_limiter import host_limiter
+from src.services.storage import storage_manager
+from src.services.status import status_updates
 from src.services.uploader import uploader
+from src.services.ytdlp_pool import ytdlp_pool
+from src.services.postprocess import postprocess_policy
+from src.services.ytdlp import YtDlpService
+from src.services.pipeline import submit_job
 from src.utils.logger import logger
-from src.utils.helpers import is_platform_url, delete_file, format_bytes
-from src.config import config
-import os
-import asyncio
 
 router = APIRouter()
 
@@ -19,148 +26,97 @@ class DownloadRequest(BaseModel):
     fileName: str | None = None
     timestamp: int
 
-# Progress tracking
-upload_progress = {}
-
-async def progress_callback(current, total, chat_id, message_id):
-    """Progress callback for upload"""
-    try:
-        percent = (current / total) * 100
-        
-        # Update only every 5%
-        key = f"{chat_id}_{message_id}"
-        last_percent = upload_progress.get(key, 0)
-        
-        if percent - last_percent >= 5 or current == total:
-            upload_progress[key] = percent
-            
-            await uploader.edit_message(
-                chat_id,
-                message_id,
-                f"⏫ در حال آپلود...\n📊 {percent:.1f}%\n📦 {format_bytes(current)} / {format_bytes(total)}"
-            )
-    except Exception as e:
-        logger.debug(f"Progress update failed: {e}")
+class InfoRequest(BaseModel):
+    url: str
 
-@router.post("/download")
+@router.post("/download", status_code=202)
 async def download_file(req: DownloadRequest):
-    """Handle download request"""
-    
+    """Queue download request"""
+
     logger.info(f"Job received: {req.url} for user {req.userId}")
-    
-    filepath = None
-    status_msg = None
-    
+
+    job = Job(
+        url=req.url,
+        chat_id=req.chatId,
+        message_id=req.messageId,
+        user_id=req.userId,
+        file_name=req.fileName
+    )
+
     try:
-        # Send status
-        status_msg = await uploader.send_message(
-            chat_id=req.chatId,
-            text="🚀 سرور شروع به کار کرد...\n⏬ در حال دانلود...",
-            reply_to=req.messageId
-        )
-        
-        # Determine download method
-        use_ytdlp = is_platform_url(req.url)
-        
-        if use_ytdlp:
-            logger.info("Using yt-dlp")
-            await uploader.edit_message(
-                req.chatId,
-                status_msg.id,
-                "🎵 دانلود از پلتفرم...\n⏳ این کار ممکنه چند دقیقه طول بکشه..."
-            )
-            
-            ytdlp = YtDlpService()
-            filepath = await ytdlp.download(req.url, req.fileName)
-        else:
-            logger.info("Using direct download")
-            downloader = DownloaderService()
-            filepath = await downloader.download(req.url)
-        
-        # Get file size
-        file_size = os.path.getsize(filepath)
-        file_size_mb = file_size / 1024 / 1024
-        
-        logger.info(f"Download complete: {format_bytes(file_size)}")
-        
-        # Update status
-        await uploader.edit_message(
-            req.chatId,
-            status_msg.id,
-            f"✅ دانلود تمام شد!\n📦 حجم: {file_size_mb:.2f} MB\n⏫ شروع آپلود به تلگرام..."
-        )
-        
-        # Determine filename
-        final_filename = req.fileName if req.fileName else os.path.basename(filepath)
-        
-        # Upload to backup channel with progress
-        backup_msg = await uploader.upload_document(
-            chat_id=config.BACKUP_CHANNEL_ID,
-            filepath=filepath,
-            filename=final_filename,
-            caption=f"🔗 {req.url}\n👤 User: {req.userId}\n📦 {format_bytes(file_size)}",
-            progress_callback=lambda c, t: progress_callback(c, t, req.chatId, status_msg.id)
-        )
-        
-        logger.info(f"Uploaded to backup channel")
-        
-        # Update status
-        await uploader.edit_message(
-            req.chatId,
-            status_msg.id,
-            f"✅ آپلود تمام شد!\n📤 در حال ارسال به شما..."
-        )
-        
-        # Forward to user
-        await uploader.forward_message(
-            to_chat=req.chatId,
-            from_chat=config.BACKUP_CHANNEL_ID,
-            message_id=backup_msg.id,
-            reply_to=req.messageId
-        )
-        
-        # Final status
-        await uploader.edit_message(
-            req.chatId,
-            status_msg.id,
-            f"✅ تکمیل شد!\n📦 {file_size_mb:.2f} MB"
-        )
-        
-        # Cleanup progress tracking
-        key = f"{req.chatId}_{status_msg.id}"
-        if key in upload_progress:
-            del upload_progress[key]
-        
-        logger.info(f"Job completed successfully: {req.url}")
-        
-        return {
-            "success": True,
-            "fileSize": file_size,
-            "fileId": backup_msg.document.id
-        }
-        
+        await submit_job(job)
+    except QueueFullError as e:
+        logger.warning(f"Job rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "success": True,
+        "jobId": job.id,
+        "status": job.status,
+        "queueDepth": job_manager.stats()["queueDepth"]
+    }
+
+@router.post("/info")
+async def media_info(req: InfoRequest):
+    """Media info without downloading (shares the download's extraction cache)"""
+    try:
+        info, cached = await YtDlpService().get_info(req.url)
     except Exception as e:
-        logger.error(f"Job failed: {str(e)}", exc_info=True)
-        
-        # Notify user
-        if status_msg:
-            try:
-                error_msg = str(e)
-                if len(error_msg) > 100:
-                    error_msg = error_msg[:100] + "..."
-                
-                await uploader.edit_message(
-                    req.chatId,
-                    status_msg.id,
-                    f"❌ خطا در دانلود:\n{error_msg}\n\n💡 نکات:\n• اگه لینک نیاز به لاگین داره، cookies.txt رو اضافه کن\n• برخی سایت‌ها ممکنه VPN نیاز داشته باشن"
-                )
-            except Exception as edit_error:
-                logger.error(f"Failed to send error message: {edit_error}")
-        
-        raise HTTPException(status_code=500, detail=str(e))
-        
-    finally:
-        # Cleanup
-        if filepath and os.path.exists(filepath):
-            await delete_file(filepath)
-            logger.debug(f"Cleaned up: {filepath}")
\ No newline at end of file
+        logger.warning(f"Info extraction failed: {req.url} {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {
+        "success": True,
+        "cached": cached,
+        "title": info.get('title'),
+        "duration": info.get('duration'),
+        "uploader": info.get('uploader'),
+        "thumbnail": info.get('thumbnail'),
+        "extractor": info.get('extractor_key'),
+        "fileSize": info.get('filesize') or info.get('filesize_approx'),
+        "formats": len(info.get('formats') or [])
+    }
+
+@router.get("/jobs")
+async def jobs_stats():
+    """Queue depth and worker pool stats"""
+    return {
+        **job_manager.stats(),
+        "statusUpdates": status_updates.stats(),
+        "uploadBots": uploader.stats()["bots"],
+        "ytdlpWorkers": ytdlp_pool.stats(),
+        "postprocess": postprocess_policy.stats(),
+        "hosts": host_limiter.stats()
+    }
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Job status"""
+    job = await job_manager.lookup(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/cache")
+async def cache_stats():
+    """Dedup cache hit/miss counters"""
+    return {
+        **file_cache.stats(),
+        "coalescing": coalescer.stats(),
+        "info": info_cache.stats()
+    }
+
+@router.get("/http")
+async def http_stats():
+    """HTTP connection pool stats"""
+    return http_sessions.stats()
+
+@router.get("/storage")
+async def storage_stats():
+    """Temp storage usage and reservations"""
+    return storage_manager.stats()
+
+@router.get("/proxies")
+async def proxy_stats():
+    """Proxy health, scores and circuit breaker state"""
+    return proxy_pool.stats()
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import time
+from src.config import config
+from src.utils.logger import logger
+from src.utils.helpers import normalize_url
+
+
+class FileCache:
+    """
+    Persistent index of files already uploaded to the backup channel
+
+    Maps normalized URL (and content SHA-256) to the backup message and
+    its Telegram document, so repeated links are delivered by forwarding
+    instead of downloading and uploading again. Entries expire after
+    CACHE_TTL and the least recently used ones are evicted above
+    CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.hash_hits = 0
+        self.misses = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    url_key TEXT PRIMARY KEY,
+                    sha256 TEXT,
+                    file_name TEXT,
+                    file_size INTEGER,
+                    message_id INTEGER NOT NULL,
+                    document_id INTEGER,
+                    access_hash INTEGER,
+                    file_reference BLOB,
+                    caption TEXT,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            columns = {row['name'] for row in self._db.execute("PRAGMA table_info(files)")}
+            if 'caption' not in columns:
+                self._db.execute("ALTER TABLE files ADD COLUMN caption TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used)")
+        return self._db
+
+    @staticmethod
+    def url_key(url: str, file_name: str | None = None) -> str:
+        # Custom filename is part of the key: it's baked into the uploaded document
+        return f"{normalize_url(url)}|{file_name or ''}"
+
+    def get(self, url: str, file_name: str | None = None) -> dict | None:
+        """Look up by URL"""
+        key = self.url_key(url, file_name)
+        row = self.db.execute(
+            "SELECT * FROM files WHERE url_key = ? AND created_at > ?",
+            (key, time.time() - config.CACHE_TTL)
+        ).fetchone()
+
+        if not row:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(key)
+        return dict(row)
+
+    def get_by_hash(self, sha256: str, file_name: str | None = None) -> dict | None:
+        """Look up by content hash (same file behind a different URL)"""
+        row = self.db.execute(
+            """
+            SELECT * FROM files WHERE sha256 = ? AND file_name IS ? AND created_at > ?
+            ORDER BY last_used DESC LIMIT 1
+            """,
+            (sha256, file_name, time.time() - config.CACHE_TTL)
+        ).fetchone()
+        if not row:
+            return None
+
+        self.hash_hits += 1
+        self._touch(row['url_key'])
+        return dict(row)
+
+    def put(
+        self,
+        url: str,
+        message,
+        sha256: str | None = None,
+        file_name: str | None = None
+    ) -> dict:
+        """Remember an uploaded backup message, returns the new entry"""
+        now = time.time()
+        document = getattr(message, 'document', None)
+
+        entry = {
+            'url_key': self.url_key(url, file_name),
+            'sha256': sha256,
+            'file_name': file_name,
+            'file_size': document.size if document else None,
+            'message_id': message.id,
+            'document_id': document.id if document else None,
+            'access_hash': document.access_hash if document else None,
+            'file_reference': document.file_reference if document else None,
+            'caption': getattr(message, 'message', None),
+            'created_at': now,
+            'last_used': now
+        }
+        self._insert(entry)
+        self._evict()
+        return entry
+
+    def alias(self, url: str, entry: dict, file_name: str | None = None):
+        """Point another URL at an existing entry"""
+        self._insert({
+            **entry,
+            'url_key': self.url_key(url, file_name),
+            'last_used': time.time()
+        })
+
+    def update_reference(self, message_id: int, file_reference: bytes):
+        """Store a refreshed file reference for a backup message"""
+        self.db.execute(
+            "UPDATE files SET file_reference = ? WHERE message_id = ?",
+            (file_reference, message_id)
+        )
+
+    def invalidate(self, message_id: int):
+        """Drop every entry that points at a backup message"""
+        self.db.execute("DELETE FROM files WHERE message_id = ?", (message_id,))
+        logger.info(f"Cache invalidated: message {message_id}")
+
+    def stats(self) -> dict:
+        entries = self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "maxEntries": config.CACHE_MAX_ENTRIES,
+            "hits": self.hits,
+            "hashHits": self.hash_hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+    def _insert(self, entry: dict):
+        self.db.execute(
+            """
+            INSERT OR REPLACE INTO files
+                (url_key, sha256, file_name, file_size, message_id, document_id,
+                 access_hash, file_reference, caption, created_at, last_used)
+            VALUES
+                (:url_key, :sha256, :file_name, :file_size, :message_id, :document_id,
+                 :access_hash, :file_reference, :caption, :created_at, :last_used)
+            """,
+            entry
+        )
+
+    def _touch(self, key: str):
+        self.db.execute("UPDATE files SET last_used = ? WHERE url_key = ?", (time.time(), key))
+
+    def _evict(self):
+        self.db.execute("DELETE FROM files WHERE created_at <= ?", (time.time() - config.CACHE_TTL,))
+        self.db.execute(
+            """
+            DELETE FROM files WHERE url_key IN (
+                SELECT url_key FROM files ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (config.CACHE_MAX_ENTRIES,)
+        )
+
+# Global instance
+file_cache = FileCache(config.CACHE_DB)
@@ -0,0 +1,71 @@
+import asyncio
+from src.services.status import status_updates
+from src.utils.logger import logger
+
+
+class Flight:
+    """One in-progress download shared by every job asking for the same file"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.watchers: list[tuple[int, int]] = []  # (chat_id, status message id)
+        self.followers = 0
+        self.last_text: str | None = None
+
+    def watch(self, chat_id: int, message_id: int):
+        """Fan out status updates to another status message"""
+        self.watchers.append((chat_id, message_id))
+        if self.last_text:
+            status_updates.update(chat_id, message_id, self.last_text)
+
+    def broadcast(self, text: str):
+        """Update every watching status message"""
+        self.last_text = text
+        for chat_id, message_id in self.watchers:
+            status_updates.update(chat_id, message_id, text)
+
+
+class Coalescer:
+    """
+    Single-flight registry keyed by normalized URL and format options
+
+    The first job for a key does the work, later jobs for the same key
+    wait for its result instead of downloading and uploading again.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, Flight] = {}
+
+    def get(self, key: str) -> Flight | None:
+        return self._flights.get(key)
+
+    def start(self, key: str) -> Flight:
+        flight = Flight(key)
+        self._flights[key] = flight
+        return flight
+
+    def finish(self, key: str, result: dict):
+        flight = self._flights.pop(key, None)
+        if flight and not flight.future.done():
+            flight.future.set_result(result)
+            if flight.followers:
+                logger.info(f"Coalesced {flight.followers + 1} jobs: {key}")
+
+    def fail(self, key: str, error: BaseException):
+        flight = self._flights.pop(key, None)
+        if flight and not flight.future.done():
+            if not isinstance(error, Exception):
+                error = Exception("Download was cancelled")
+            flight.future.set_exception(error)
+            # Mark retrieved, nobody may be waiting
+            flight.future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._flights),
+            "waiters": sum(f.followers for f in self._flights.values())
+        }
+
+# Global instance
+coalescer = Coalescer()
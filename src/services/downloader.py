@@ -1,18 +1,34 @@
 import os
 import asyncio
+import fcntl
 import subprocess
 import json
 import re
+import time
+import hashlib
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
-from urllib.parse import urlparse
+from urllib.parse import urlparse, unquote
 import aiohttp
 import aiofiles
+from src.services.http import http_sessions
+from src.services.proxy_pool import proxy_pool
+from src.services.host_limiter import host_limiter, parse_retry_after
+from src.services.ytdlp import YtDlpService
+from src.services.storage import Reservation, StorageFullError
 from src.utils.logger import logger
-from src.utils.helpers import get_random_user_agent, get_random_proxy, get_temp_filepath, format_bytes
+from src.utils.url_router import url_router
+from src.utils.helpers import get_random_user_agent, get_temp_filepath, format_bytes, normalize_url, sanitize_filename
 from src.config import config
 
 
+class PermanentDownloadError(Exception):
+    """خطایی که با تلاش مجدد درست نمیشه (مثلا 404 یا حجم زیاد)"""
+
+
 class DownloaderService:
     """
     دانلودر هوشمند با پشتیبانی از:
@@ -21,30 +37,8 @@ class DownloaderService:
     - تشخیص خودکار بهترین روش دانلود
     """
     
-    # سایت‌هایی که نیاز به yt-dlp دارن
-    VIDEO_SITES = [
-        'youtube.com', 'youtu.be',
-        'pornhub.com', 'pornhub.org', 'pornhub.net', 'de.pornhub.org',
-        'xvideos.com',
-        'xnxx.com',
-        'twitter.com', 'x.com',
-        'instagram.com',
-        'tiktok.com',
-        'reddit.com',
-        'vimeo.com',
-        'dailymotion.com',
-        'facebook.com', 'fb.watch',
-        'twitch.tv',
-        'streamable.com',
-    ]
-    
-    # پسوندهایی که لینک مستقیم فایل هستن
-    DIRECT_EXTENSIONS = [
-        '.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.wmv',  # Video
-        '.mp3', '.m4a', '.wav', '.flac', '.ogg', '.aac',          # Audio
-        '.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp',         # Image
-        '.pdf', '.zip', '.rar', '.7z', '.tar', '.gz',             # Document
-    ]
+    # Partial file path -> [lock, users], shared by all instances
+    _path_locks: dict = {}
     
     def __init__(self, cookies_file: Optional[str] = None):
         """
@@ -53,6 +47,9 @@ class DownloaderService:
         """
         self.cookies_file = Path(cookies_file) if cookies_file else None
         
+        # Engine of the last download() ('direct' or 'ytdlp'), for metrics
+        self.engine = None
+        
         # چک کردن وجود cookies
         if self.cookies_file and self.cookies_file.exists():
             logger.info(f"Using cookies: {self.cookies_file}")
@@ -81,97 +78,485 @@ class DownloaderService:
         except Exception as e:
             logger.warning(f"yt-dlp check failed: {e}")
     
-    def _is_video_site(self, url: str) -> bool:
-        """چک کردن اینکه URL از سایت ویدیویی هست یا نه"""
-        try:
-            domain = urlparse(url).netloc.lower()
-            domain = domain.replace('www.', '')
-            return any(site in domain for site in self.VIDEO_SITES)
-        except:
-            return False
-    
-    def _is_direct_link(self, url: str) -> bool:
-        """چک کردن اینکه URL لینک مستقیم فایل هست یا نه"""
-        try:
-            path = urlparse(url).path.lower()
-            return any(path.endswith(ext) for ext in self.DIRECT_EXTENSIONS)
-        except:
-            return False
-    
-    async def download(self, url: str) -> str:
+    async def download(self, url: str, reservation: Optional[Reservation] = None) -> str:
         """
         دانلود هوشمند - تشخیص خودکار بهترین روش
         
         Args:
             url: آدرس فایل یا ویدیو
-            
+            reservation: فضای دیسک این کار (قبل از نوشتن فایل رزرو میشه)
+        
         Returns:
             filepath: مسیر فایل دانلود شده
         """
         
         # تشخیص نوع لینک
-        if self._is_video_site(url):
+        route = url_router.route(url)
+        if route.engine in ('platform', 'video'):
             logger.info(f"Detected video site: {url}")
-            return await self._download_with_ytdlp(url)
+            self.engine = 'ytdlp'
+            return await self._download_with_ytdlp(url, reservation)
         
-        elif self._is_direct_link(url):
+        elif route.engine == 'direct':
             logger.info(f"Detected direct link: {url}")
-            return await self._download_direct(url)
+            self.engine = 'direct'
+            return await self._download_direct(url, reservation)
         
         else:
             # تلاش با yt-dlp (شاید ساپورت کنه)
             logger.info(f"Trying yt-dlp for: {url}")
             try:
-                return await self._download_with_ytdlp(url)
+                self.engine = 'ytdlp'
+                return await self._download_with_ytdlp(url, reservation)
             except Exception as e:
                 logger.warning(f"yt-dlp failed: {e}, trying direct download")
-                return await self._download_direct(url)
+                self.engine = 'direct'
+                return await self._download_direct(url, reservation)
     
-    async def _download_direct(self, url: str) -> str:
-        """دانلود مستقیم فایل"""
-        filepath = get_temp_filepath()
-        user_agent = get_random_user_agent()
-        proxy = get_random_proxy()
-        
-        headers = {
-            'User-Agent': user_agent,
-            'Accept': '*/*',
-            'Accept-Language': 'en-US,en;q=0.9',
-        }
+    async def _download_direct(self, url: str, reservation: Optional[Reservation] = None) -> str:
+        """
+        دانلود مستقیم فایل
+        
+        فایل نیمه‌کاره با یک فایل وضعیت (sidecar) کنارش نگه داشته میشه،
+        پس تلاش بعدی (حتی بعد از ری‌استارت) از آخرین بایت سالم ادامه میده
+        """
+        partial_path = self._partial_path(url)
+        
+        async with self._path_lock(partial_path):
+            for attempt in range(1, config.DOWNLOAD_RETRIES + 1):
+                try:
+                    await self._download_direct_once(url, partial_path, reservation)
+                    break
+                except (PermanentDownloadError, StorageFullError):
+                    raise
+                except Exception as e:
+                    if attempt == config.DOWNLOAD_RETRIES:
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning(f"Direct download attempt {attempt} failed: {e}, retrying in {delay}s")
+                    await asyncio.sleep(delay)
+            
+            # Move out of the resumable path so a new job for the same URL can't touch it
+            filepath = get_temp_filepath()
+            os.replace(partial_path, filepath)
+            self._clear_state(partial_path)
+            return filepath
+    
+    async def _download_direct_once(self, url: str, filepath: str, reservation: Optional[Reservation] = None):
+        """یک بار تلاش برای دانلود مستقیم (نتیجه به امتیاز پروکسی اضافه میشه)"""
+        proxy = proxy_pool.choose(url)
+        try:
+            latency, size, seconds = await self._fetch_direct(url, filepath, proxy, reservation)
+        except StorageFullError:
+            raise
+        except Exception as e:
+            proxy_pool.record_error(proxy, url, e)
+            raise
+        proxy_pool.record_success(proxy, url, latency, size, seconds)
+    
+    async def _fetch_direct(
+        self,
+        url: str,
+        filepath: str,
+        proxy: Optional[str],
+        reservation: Optional[Reservation] = None
+    ) -> tuple[float, int, float]:
+        """دانلود مستقیم از طریق `proxy`، خروجی: (تاخیر اولین پاسخ، بایت‌های دریافتی، زمان انتقال)"""
+        headers = self._build_headers()
         
         logger.info(f"Direct downloading: {url}")
-        logger.info(f"User-Agent: {user_agent}")
+        logger.info(f"User-Agent: {headers['User-Agent']}")
         if proxy:
             logger.info(f"Using proxy: {proxy}")
         
-        timeout = aiohttp.ClientTimeout(total=3600)  # 1 hour
+        session = http_sessions.get(proxy)
+        
+        # Probe with a one-byte range: 206 means the server can split and resume the file
+        probe_headers = {**headers, 'Range': 'bytes=0-0'}
+        async with host_limiter.slot(url):
+            started = time.monotonic()
+            async with session.get(url, headers=probe_headers, proxy=proxy) as response:
+                latency = time.monotonic() - started
+                if response.status == 206:
+                    file_size = self._parse_content_range(response.headers.get('content-range'))
+                    validator = self._get_validator(response.headers)
+                    # Drain the single byte so the connection goes back to the pool
+                    await response.read()
+                elif response.status == 200:
+                    # No range support, the probe is already the full download
+                    self._clear_state(filepath)
+                    self._check_size(response.headers.get('content-length'))
+                    await self._reserve(reservation, response.headers.get('content-length'))
+                    started = time.monotonic()
+                    await self._download_stream(response, filepath)
+                    return latency, os.path.getsize(filepath), time.monotonic() - started
+                else:
+                    self._raise_for_status(url, response, proxy)
         
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=headers, proxy=proxy) as response:
+        if file_size is None:
+            # Unknown total size, fall back to a single stream
+            self._clear_state(filepath)
+            async with host_limiter.slot(url), session.get(url, headers=headers, proxy=proxy) as response:
                 if response.status != 200:
-                    raise Exception(f"HTTP {response.status}")
-                
-                # Check file size
-                content_length = response.headers.get('content-length')
-                if content_length:
-                    file_size = int(content_length)
-                    if file_size > config.MAX_FILE_SIZE:
-                        raise Exception(f"File too large: {format_bytes(file_size)}")
-                    logger.info(f"File size: {format_bytes(file_size)}")
-                
-                # Download
-                async with aiofiles.open(filepath, 'wb') as f:
-                    downloaded = 0
-                    async for chunk in response.content.iter_chunked(1024 * 1024):  # 1MB chunks
-                        await f.write(chunk)
-                        downloaded += len(chunk)
-                
-                actual_size = os.path.getsize(filepath)
-                logger.info(f"Downloaded: {format_bytes(actual_size)}")
+                    self._raise_for_status(url, response, proxy)
+                self._check_size(response.headers.get('content-length'))
+                await self._reserve(reservation, response.headers.get('content-length'))
+                started = time.monotonic()
+                await self._download_stream(response, filepath)
+                return latency, os.path.getsize(filepath), time.monotonic() - started
+        
+        self._check_size(file_size)
+        await self._reserve(reservation, file_size)
+        started = time.monotonic()
+        fetched = await self._download_segmented(session, url, headers, proxy, filepath, file_size, validator)
+        return latency, fetched, time.monotonic() - started
+    
+    @asynccontextmanager
+    async def stream(self, url: str):
+        """
+        استریم مستقیم فایل بدون ذخیره روی دیسک
+        
+        خروجی: (حجم، iterator تکه‌ها، اسم فایل) یا None اگه حجم فایل از قبل معلوم نباشه
+        """
+        headers = self._build_headers()
+        # Content-Length must match the bytes we get
+        headers['Accept-Encoding'] = 'identity'
+        proxy = proxy_pool.choose(url)
+        
+        logger.info(f"Streaming: {url}")
+        if proxy:
+            logger.info(f"Using proxy: {proxy}")
+        
+        session = http_sessions.get(proxy)
+        try:
+            async with host_limiter.slot(url):
+                started = time.monotonic()
+                async with session.get(url, headers=headers, proxy=proxy) as response:
+                    latency = time.monotonic() - started
+                    if response.status != 200:
+                        self._raise_for_status(url, response, proxy)
+                    
+                    content_length = response.headers.get('content-length')
+                    if not content_length:
+                        yield None
+                        return
+                    
+                    self._check_size(content_length)
+                    filename = sanitize_filename(unquote(os.path.basename(urlparse(url).path))) or 'download'
+                    started = time.monotonic()
+                    yield int(content_length), response.content.iter_chunked(1024 * 1024), filename
+        except Exception as e:
+            # Upload errors thrown in here aren't the proxy's fault, the classifier skips them
+            proxy_pool.record_error(proxy, url, e)
+            raise
+        proxy_pool.record_success(proxy, url, latency, int(content_length), time.monotonic() - started)
+    
+    @staticmethod
+    async def _reserve(reservation: Optional[Reservation], size):
+        """رزرو فضای دیسک قبل از نوشتن فایل (حجم نامعلوم = مقدار پیش‌فرض)"""
+        if reservation:
+            await reservation.reserve(int(size) if size else None)
+    
+    @staticmethod
+    def _build_headers() -> dict:
+        return {
+            'User-Agent': get_random_user_agent(),
+            'Accept': '*/*',
+            'Accept-Language': 'en-US,en;q=0.9',
+        }
+    
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """تاخیر نمایی بین تلاش‌ها"""
+        return min(config.RETRY_BACKOFF * 2 ** (attempt - 1), config.RETRY_BACKOFF_MAX)
+    
+    @staticmethod
+    def _raise_for_status(url: str, response: aiohttp.ClientResponse, proxy: Optional[str] = None):
+        status = response.status
+        if status in (429, 503):
+            # Slow down every request to this host, not just this retry
+            host_limiter.throttle(url, parse_retry_after(response.headers.get('retry-after')))
+        
+        if status == 403 and proxy and proxy_pool.has_alternative(proxy, url):
+            # Likely the proxy's exit is banned: the error benches it for this
+            # domain and the retry goes through another one
+            raise Exception(f"HTTP {status} through proxy")
+        
+        # Client errors won't fix themselves on retry (except timeouts / rate limits)
+        if 400 <= status < 500 and status not in (408, 425, 429):
+            raise PermanentDownloadError(f"HTTP {status}")
+        raise Exception(f"HTTP {status}")
+    
+    @staticmethod
+    def _get_validator(headers) -> Optional[str]:
+        """ETag قوی یا Last-Modified برای If-Range"""
+        etag = headers.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return headers.get('last-modified')
+    
+    def _check_size(self, content_length):
+        """چک کردن محدودیت حجم"""
+        if not content_length:
+            return
+        file_size = int(content_length)
+        if file_size > config.MAX_FILE_SIZE:
+            raise PermanentDownloadError(f"File too large: {format_bytes(file_size)}")
+        logger.info(f"File size: {format_bytes(file_size)}")
+    
+    @staticmethod
+    def _parse_content_range(content_range: Optional[str]) -> Optional[int]:
+        """حجم کل از هدر Content-Range (مثال: bytes 0-0/12345)"""
+        if not content_range or '/' not in content_range:
+            return None
+        total = content_range.rsplit('/', 1)[1].strip()
+        return int(total) if total.isdigit() else None
+    
+    @staticmethod
+    def _partial_path(url: str) -> str:
+        """مسیر ثابت فایل نیمه‌کاره برای هر URL"""
+        digest = hashlib.sha1(normalize_url(url).encode()).hexdigest()[:20]
+        return os.path.join(config.DOWNLOAD_DIR, f"direct_{digest}.part")
+    
+    @asynccontextmanager
+    async def _path_lock(self, path: str):
+        """
+        Only one download per partial file at a time
+
+        The asyncio lock orders jobs of this process, the flock on
+        `path`.lock keeps out other workers and nodes sharing DOWNLOAD_DIR.
+        The lock file only exists while a download holds it.
+        """
+        entry = self._path_locks.setdefault(path, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                fd = await self._flock(path + '.lock')
+                try:
+                    yield
+                finally:
+                    # Removed while still held: a waiter's flock lands on the
+                    # unlinked inode, which _flock notices and retries
+                    try:
+                        os.remove(path + '.lock')
+                    except OSError:
+                        pass
+                    os.close(fd)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._path_locks[path]
+    
+    @staticmethod
+    async def _flock(path: str) -> int:
+        """Exclusive flock on `path`, polled so the event loop isn't blocked"""
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                await asyncio.sleep(0.5)
+                continue
+            except BaseException:
+                os.close(fd)
+                raise
+            
+            # The sweeper may have removed the file meanwhile, then the lock is on a stale inode
+            try:
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+    
+    @staticmethod
+    def _load_state(filepath: str) -> Optional[dict]:
+        """خوندن وضعیت دانلود نیمه‌کاره"""
+        try:
+            with open(filepath + '.json') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _save_state(filepath: str, state: dict):
+        """ذخیره وضعیت دانلود (نوشتن اتمیک)"""
+        state['updated_at'] = time.time()
+        tmp_path = filepath + '.json.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, filepath + '.json')
+    
+    @staticmethod
+    def _clear_state(filepath: str):
+        try:
+            os.remove(filepath + '.json')
+        except OSError:
+            pass
+    
+    async def _download_stream(self, response: aiohttp.ClientResponse, filepath: str):
+        """دانلود با یک اتصال"""
+        async with aiofiles.open(filepath, 'wb') as f:
+            async for chunk in response.content.iter_chunked(1024 * 1024):  # 1MB chunks
+                await f.write(chunk)
+        
+        actual_size = os.path.getsize(filepath)
+        logger.info(f"Downloaded: {format_bytes(actual_size)}")
+    
+    async def _download_segmented(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        headers: dict,
+        proxy: Optional[str],
+        filepath: str,
+        file_size: int,
+        validator: Optional[str]
+    ) -> int:
+        """
+        دانلود چندبخشی - فایل به چند بازه تقسیم میشه و هر بازه
+        با یک اتصال جدا دانلود و مستقیم در جای خودش نوشته میشه
+        
+        خروجی: تعداد بایت‌هایی که این بار دانلود شد (بدون قسمت ادامه داده شده)
+        """
+        state = self._load_state(filepath)
+        resumable = (
+            state is not None
+            and validator is not None
+            and state.get('url') == url
+            and state.get('size') == file_size
+            and state.get('validator') == validator
+            and os.path.exists(filepath)
+            and os.path.getsize(filepath) == file_size
+        )
+        
+        done = 0
+        if resumable:
+            done = sum(position - start for start, end, position in state['segments'])
+            logger.info(f"Resuming download at {format_bytes(done)} / {format_bytes(file_size)}")
+        else:
+            segment_size = max(config.SEGMENT_MIN_SIZE, -(-file_size // max(config.DOWNLOAD_SEGMENTS, 1)))
+            state = {
+                'url': url,
+                'size': file_size,
+                'validator': validator,
+                # [start, end, next byte to fetch]
+                'segments': [
+                    [start, min(start + segment_size, file_size) - 1, start]
+                    for start in range(0, file_size, segment_size)
+                ],
+            }
+            logger.info(f"Segmented download: {len(state['segments'])} x {format_bytes(segment_size)}")
+        
+        flags = os.O_WRONLY | os.O_CREAT | (0 if resumable else os.O_TRUNC)
+        fd = os.open(filepath, flags, 0o644)
+        # Executor writes can't be cancelled, fd stays open until they're all done
+        writes: set[asyncio.Future] = set()
+        try:
+            if not resumable:
+                # Preallocate so segments can be written at their offsets
+                try:
+                    os.posix_fallocate(fd, 0, file_size)
+                except (AttributeError, OSError):
+                    os.ftruncate(fd, file_size)
+            
+            # Without a validator there's no way to tell a resumed file is still the same
+            persist = validator is not None
+            if persist:
+                self._save_state(filepath, state)
+            
+            tasks = [
+                asyncio.create_task(
+                    self._download_segment(
+                        session, url, headers, proxy, validator, fd, writes, segment, filepath,
+                        state if persist else None
+                    )
+                )
+                for segment in state['segments']
+                if segment[2] <= segment[1]
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                if persist:
+                    self._save_state(filepath, state)
+        finally:
+            if writes:
+                await asyncio.gather(*writes, return_exceptions=True)
+            os.close(fd)
+        
+        logger.info(f"Downloaded: {format_bytes(file_size)}")
+        return file_size - done
+    
+    async def _download_segment(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        headers: dict,
+        proxy: Optional[str],
+        validator: Optional[str],
+        fd: int,
+        writes: set,
+        segment: list,
+        filepath: str,
+        state: Optional[dict]
+    ):
+        """دانلود یک بازه با تلاش مجدد (از همون جایی که قطع شده ادامه میده)"""
+        loop = asyncio.get_running_loop()
+        start, end, _ = segment
+        changed = False
+        last_save = time.monotonic()
+        
+        for attempt in range(1, config.SEGMENT_RETRIES + 1):
+            range_headers = {**headers, 'Range': f'bytes={segment[2]}-{end}'}
+            if validator:
+                # Server sends the whole file (200) instead if it has changed
+                range_headers['If-Range'] = validator
+            
+            try:
+                async with host_limiter.slot(url), session.get(url, headers=range_headers, proxy=proxy) as response:
+                    if response.status == 200 and validator:
+                        changed = True
+                        self._clear_state(filepath)
+                        raise Exception("File changed on server during download")
+                    if response.status in (429, 503):
+                        host_limiter.throttle(url, parse_retry_after(response.headers.get('retry-after')))
+                    if response.status != 206:
+                        raise Exception(f"HTTP {response.status} for range {segment[2]}-{end}")
+                    
+                    async for chunk in response.content.iter_chunked(1024 * 1024):
+                        chunk = chunk[:end + 1 - segment[2]]
+                        write = loop.run_in_executor(None, os.pwrite, fd, chunk, segment[2])
+                        writes.add(write)
+                        write.add_done_callback(writes.discard)
+                        # Shielded: a cancel mustn't mark the write done while the thread still runs
+                        await asyncio.shield(write)
+                        segment[2] += len(chunk)
+                        
+                        if state is not None and time.monotonic() - last_save > 1:
+                            self._save_state(filepath, state)
+                            last_save = time.monotonic()
+                        
+                        if segment[2] > end:
+                            break
                 
-                return filepath
+                if segment[2] <= end:
+                    raise Exception(f"Range {start}-{end} ended at {segment[2]}")
+                return
+            
+            except Exception as e:
+                if changed or attempt == config.SEGMENT_RETRIES:
+                    raise Exception(f"Segment {start}-{end} failed: {e}")
+                logger.warning(f"Segment {start}-{end} attempt {attempt} failed: {e}")
+                await asyncio.sleep(self._backoff(attempt))
     
-    async def _download_with_ytdlp(self, url: str) -> str:
+    async def _download_with_ytdlp(self, url: str, reservation: Optional[Reservation] = None) -> str:
         """
         دانلود با yt-dlp
         
@@ -179,11 +564,13 @@ class DownloaderService:
         خود ویدیو رو دانلود می‌کنه نه فایل PHP
         """
         
-        # تعیین مسیر خروجی
-        output_dir = Path("/tmp/downloads")
-        output_dir.mkdir(exist_ok=True)
+        # حجم از قبل معلوم نیست، مقدار پیش‌فرض رزرو میشه
+        await self._reserve(reservation, None)
         
-        output_template = str(output_dir / "%(id)s.%(ext)s")
+        # هر کار پوشه‌ی خودش رو داره، پس کارهای همزمان فایل همدیگه رو برنمی‌دارن
+        job_dir = tempfile.mkdtemp(prefix='ytdlp_job_', dir=config.DOWNLOAD_DIR)
+        
+        output_template = os.path.join(job_dir, "%(id)s.%(ext)s")
         
         # ساخت دستور yt-dlp
         cmd = [
@@ -192,6 +579,8 @@ class DownloaderService:
             '--no-check-certificate',
             '-o', output_template,
             '-f', 'best[ext=mp4]/best',  # اولویت به MP4
+            # مسیر دقیق فایل نهایی (بعد از پردازش و انتقال) چاپ میشه
+            '--print', 'after_move:filepath',
         ]
         
         # افزودن cookies (اگه موجود باشه)
@@ -204,72 +593,72 @@ class DownloaderService:
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         ])
         
+        # پروکسی (بهترین پروکسی سالم برای این دامنه)
+        proxy = proxy_pool.choose(url)
+        if proxy:
+            cmd.extend(['--proxy', proxy])
+            logger.info(f"Using proxy: {proxy}")
+        
         # افزودن URL
         cmd.append(url)
         
         logger.info(f"Running yt-dlp: {url}")
         
-        # اجرا
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            error = stderr.decode()
-            logger.error(f"yt-dlp failed: {error}")
-            raise Exception(f"yt-dlp failed: {error[:200]}")
-        
-        # پیدا کردن فایل دانلود شده
-        downloaded_files = list(output_dir.glob("*"))
-        if not downloaded_files:
-            raise Exception("No file downloaded!")
+        try:
+            # یک اسلات از سهم همزمانی این دامنه
+            async with host_limiter.slot(url):
+                started = time.monotonic()
+                # اجرا
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                
+                try:
+                    stdout, stderr = await process.communicate()
+                except asyncio.CancelledError:
+                    process.kill()
+                    await process.wait()
+                    raise
+                
+                if process.returncode != 0:
+                    error = stderr.decode()
+                    logger.error(f"yt-dlp failed: {error}")
+                    host_limiter.throttle_error(url, Exception(error))
+                    proxy_pool.record_error(proxy, url, Exception(error))
+                    raise Exception(f"yt-dlp failed: {error[:200]}")
+            
+            # آخرین خط خروجی مسیر فایل دانلود شده‌ست
+            lines = [line for line in stdout.decode().splitlines() if line.strip()]
+            filepath = lines[-1].strip() if lines else ''
+            if not filepath or not os.path.isfile(filepath):
+                raise Exception("No file downloaded!")
         
-        # گرفتن جدیدترین فایل
-        filepath = max(downloaded_files, key=os.path.getctime)
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
         
         file_size = os.path.getsize(filepath)
         logger.info(f"Downloaded with yt-dlp: {filepath} ({format_bytes(file_size)})")
+        proxy_pool.record_success(proxy, url, size=file_size, seconds=time.monotonic() - started)
         
-        return str(filepath)
+        return filepath
     
     async def get_video_info(self, url: str) -> Optional[dict]:
         """
         دریافت اطلاعات ویدیو (بدون دانلود)
         
-        فقط برای سایت‌های ویدیویی کار می‌کنه
+        فقط برای سایت‌های ویدیویی کار می‌کنه.
+        از همون کش اطلاعات yt-dlp استفاده می‌کنه که دانلود و /api/info ازش استفاده می‌کنن
         """
-        if not self._is_video_site(url):
+        if url_router.route(url).engine not in ('platform', 'video'):
             return None
         
         try:
-            cmd = ['yt-dlp', '--dump-json', '--no-warnings']
-            
-            # افزودن cookies
-            if self.cookies_file and self.cookies_file.exists():
-                cmd.extend(['--cookies', str(self.cookies_file)])
-            
-            cmd.append(url)
-            
             logger.info(f"Getting video info: {url}")
             
-            result = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await result.communicate()
-            
-            if result.returncode != 0:
-                error = stderr.decode()
-                logger.error(f"Failed to get info: {error}")
-                return None
-            
-            info = json.loads(stdout.decode())
+            info, _ = await YtDlpService().get_info(url)
             
             logger.info(f"Title: {info.get('title', 'Unknown')}")
             logger.info(f"Duration: {info.get('duration', 0)}s")
@@ -0,0 +1,120 @@
+import asyncio
+import copy
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+from telethon.network import MTProtoSender
+from telethon.tl.alltlobjects import LAYER
+from telethon.tl.functions import InvokeWithLayerRequest
+from telethon.tl.functions.help import GetConfigRequest
+from src.services.metrics import FLOOD_WAITS, FLOOD_WAIT_SECONDS
+from src.utils.logger import logger
+
+
+class ParallelUploader:
+    """
+    Uploads file parts concurrently over several MTProto connections
+
+    Telethon's own upload sends one part at a time over the client's
+    single connection. Here every connection gets its own sender (same
+    auth key, same DC as the client) and pulls parts from a shared queue.
+    """
+
+    PART_RETRIES = 3
+
+    def __init__(self, client: TelegramClient, connections: int, on_flood_wait=None):
+        self.client = client
+        self.connections = max(connections, 1)
+        # Called with the wait in seconds, so the caller can route around this client
+        self.on_flood_wait = on_flood_wait
+
+    async def _create_sender(self) -> MTProtoSender:
+        """Open another connection to the client's DC"""
+        dc = await self.client._get_dc(self.client.session.dc_id)
+        sender = MTProtoSender(self.client.session.auth_key, loggers=self.client._log)
+        await sender.connect(self.client._connection(
+            dc.ip_address,
+            dc.port,
+            dc.id,
+            loggers=self.client._log,
+            proxy=self.client._proxy,
+            local_addr=self.client._local_addr
+        ))
+
+        # New MTProto session: tell Telegram who we are first
+        init_request = copy.copy(self.client._init_request)
+        init_request.query = GetConfigRequest()
+        await sender.send(InvokeWithLayerRequest(LAYER, init_request))
+        return sender
+
+    async def run(self, parts: asyncio.Queue, on_part=None):
+        """
+        Upload every request from `parts` until a None sentinel
+
+        `parts` yields (part size, SaveFilePart/SaveBigFilePart request).
+        `on_part` is awaited with the part size after each upload.
+        """
+        senders = []
+        if self.connections > 1:
+            results = await asyncio.gather(
+                *[self._create_sender() for _ in range(self.connections)],
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    logger.warning(f"Extra upload connection failed: {result}")
+                else:
+                    senders.append(result)
+
+        # Fall back to the client's own connection
+        calls = [self._sender_call(sender) for sender in senders] or [self.client]
+
+        workers = [asyncio.create_task(self._worker(call, parts, on_part)) for call in calls]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        finally:
+            for sender in senders:
+                await sender.disconnect()
+
+    @staticmethod
+    def _sender_call(sender: MTProtoSender):
+        async def call(request):
+            return await sender.send(request)
+        return call
+
+    async def _worker(self, call, parts: asyncio.Queue, on_part):
+        while True:
+            item = await parts.get()
+            if item is None:
+                # Let the other workers see the end too
+                await parts.put(None)
+                return
+
+            size, request = item
+            attempt = 0
+            while True:
+                try:
+                    if not await call(request):
+                        raise Exception(f"Failed to upload part {request.file_part}")
+                    break
+                except FloodWaitError as e:
+                    # Not a failure of the part itself, wait and try again
+                    logger.warning(f"FloodWait on upload part: {e.seconds}s")
+                    FLOOD_WAITS.labels('upload').inc()
+                    FLOOD_WAIT_SECONDS.labels('upload').inc(e.seconds)
+                    if self.on_flood_wait:
+                        self.on_flood_wait(e.seconds)
+                    await asyncio.sleep(e.seconds)
+                except Exception as e:
+                    attempt += 1
+                    if attempt == self.PART_RETRIES:
+                        raise
+                    logger.warning(f"Upload part {request.file_part} attempt {attempt} failed: {e}")
+                    await asyncio.sleep(attempt)
+
+            if on_part:
+                await on_part(size)
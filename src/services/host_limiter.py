@@ -0,0 +1,223 @@
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from src.config import config
+from src.utils.logger import logger
+from src.utils.url_router import host_of
+
+
+# 429 / 503 in yt-dlp or wrapped error messages
+RATE_LIMIT_PATTERN = re.compile(r'HTTP (?:Error )?(?:429|503)\b|too many requests', re.IGNORECASE)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds from a Retry-After header (delay or HTTP date)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    """Connection limit and waiters of one host"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.limit = float(config.HOST_CONCURRENCY)
+        self.active = 0
+        self.claims = 0  # Jobs for this host handed to workers
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.parked: deque = deque()  # Callbacks of jobs held back until there's room
+        self.wake_handle: asyncio.TimerHandle | None = None
+
+        self.throttled = 0
+        self.waited = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(int(self.limit), config.HOST_MIN_CONCURRENCY)
+
+    def blocked(self, now: float) -> bool:
+        return now < self.blocked_until
+
+    def free_connections(self, now: float) -> int:
+        """Slots nobody holds or waits for"""
+        if self.blocked(now):
+            return 0
+        return max(self.capacity - self.active - len(self.waiters), 0)
+
+    def free(self, now: float) -> int:
+        """Room for another job: free slots not already claimed by starting jobs"""
+        return min(self.free_connections(now), max(self.capacity - self.claims, 0))
+
+    @property
+    def idle(self) -> bool:
+        return (
+            not self.active and not self.claims and not self.waiters and not self.parked
+            and self.limit >= config.HOST_CONCURRENCY
+            and self.blocked_until <= time.monotonic()
+        )
+
+
+class HostLimiter:
+    """
+    Per-host connection limits that adapt to rate limiting (AIMD)
+
+    Every outbound fetch holds a slot of its host. Each host starts at
+    HOST_CONCURRENCY slots; a 429/503 halves its limit (at most once a
+    second, so one burst counts once) and a Retry-After pauses the host,
+    while each clean fetch adds 1/limit back. Jobs for a host with no
+    free slot can be parked by the job manager instead of holding a
+    worker, so links to other sites keep flowing.
+    """
+
+    def __init__(self):
+        self._hosts: dict[str, HostState] = {}
+
+    def _state(self, host: str) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(host)
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Hold one connection slot of the URL's host"""
+        state = self._state(host_of(url))
+        await self._acquire(state)
+        throttled = state.throttled
+        try:
+            yield
+        except BaseException:
+            self._release(state)
+            raise
+        if state.throttled == throttled:
+            # Additive increase, about +1 per `limit` clean fetches
+            state.limit = min(state.limit + 1 / state.limit, float(config.HOST_CONCURRENCY))
+        self._release(state)
+
+    def throttle(self, url: str, retry_after: float | None = None):
+        """Report a 429/503 from the URL's host"""
+        state = self._state(host_of(url))
+        now = time.monotonic()
+        state.throttled += 1
+
+        if now - state.last_decrease >= 1:
+            # Multiplicative decrease
+            state.limit = max(state.limit / 2, float(config.HOST_MIN_CONCURRENCY))
+            state.last_decrease = now
+
+        delay = retry_after if retry_after is not None else config.HOST_THROTTLE_DELAY
+        delay = min(delay, config.HOST_RETRY_AFTER_MAX)
+        if delay > 0:
+            state.blocked_until = max(state.blocked_until, now + delay)
+            self._schedule_wake(state, state.blocked_until - now)
+        logger.warning(f"Rate limited by {state.host}: limit {state.capacity}, paused {delay:.0f}s")
+
+    def throttle_error(self, url: str, error: BaseException) -> bool:
+        """throttle() if `error` is a rate limit message, e.g. from yt-dlp"""
+        if RATE_LIMIT_PATTERN.search(str(error)):
+            self.throttle(url)
+            return True
+        return False
+
+    def available(self, url: str) -> bool:
+        """Whether the URL's host has a free slot right now"""
+        state = self._hosts.get(host_of(url))
+        return state is None or state.free(time.monotonic()) > 0
+
+    def park(self, url: str, callback):
+        """Call `callback` once the URL's host has a free slot (it should claim one)"""
+        state = self._state(host_of(url))
+        state.parked.append(callback)
+        self._wake(state)
+
+    def claim(self, url: str):
+        """
+        Count a job for the URL's host from the moment it goes to a worker
+
+        Its fetches only take slots once it runs, so without a claim
+        every parked job would look like it fits at once.
+        """
+        self._state(host_of(url)).claims += 1
+
+    def unclaim(self, url: str):
+        state = self._state(host_of(url))
+        state.claims -= 1
+        self._wake(state)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            host: {
+                "limit": state.capacity,
+                "active": state.active,
+                "jobs": state.claims,
+                "waiting": len(state.waiters),
+                "parked": len(state.parked),
+                "pausedFor": max(int(state.blocked_until - now), 0),
+                "throttled": state.throttled,
+                "waited": state.waited
+            }
+            for host, state in self._hosts.items()
+        }
+
+    async def _acquire(self, state: HostState):
+        if state.free_connections(time.monotonic()) > 0:
+            state.active += 1
+            return
+
+        state.waited += 1
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled, hand it back
+                self._release(state)
+            else:
+                state.waiters.remove(future)
+                self._wake(state)
+            raise
+
+    def _release(self, state: HostState):
+        state.active -= 1
+        self._wake(state)
+
+    def _wake(self, state: HostState):
+        """Grant slots to waiters in order, then release parked jobs into what's left"""
+        now = time.monotonic()
+        if state.blocked(now):
+            return
+
+        while state.waiters and state.active < state.capacity:
+            future = state.waiters.popleft()
+            if future.done():
+                continue
+            state.active += 1
+            future.set_result(None)
+
+        while state.parked and state.free(now) > 0:
+            state.parked.popleft()()
+
+        if state.idle and self._hosts.get(state.host) is state:
+            del self._hosts[state.host]
+
+    def _schedule_wake(self, state: HostState, delay: float):
+        if state.wake_handle:
+            state.wake_handle.cancel()
+        state.wake_handle = asyncio.get_running_loop().call_later(delay, self._wake, state)
+
+# Global instance
+host_limiter = HostLimiter()
@@ -0,0 +1,65 @@
+import aiohttp
+from src.config import config
+from src.utils.logger import logger
+
+
+class HttpSessionManager:
+    """
+    Application-wide aiohttp sessions, one connection pool per proxy
+
+    Sessions keep connections alive and cache DNS between jobs, so
+    repeated downloads from the same CDN skip TCP/TLS setup and lookups.
+    """
+
+    def __init__(self):
+        self._sessions: dict[str | None, aiohttp.ClientSession] = {}
+
+    async def start(self):
+        # Pool for requests without proxy is always needed
+        self.get(None)
+        logger.info(
+            f"HTTP pools ready (limit {config.HTTP_POOL_LIMIT}, "
+            f"per host {config.HTTP_LIMIT_PER_HOST}, DNS TTL {config.HTTP_DNS_TTL}s)"
+        )
+
+    async def stop(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
+        logger.info("HTTP pools closed")
+
+    def get(self, proxy: str | None = None) -> aiohttp.ClientSession:
+        """Session whose pool is used for requests through `proxy`"""
+        session = self._sessions.get(proxy)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.HTTP_POOL_LIMIT,
+                limit_per_host=config.HTTP_LIMIT_PER_HOST,
+                ttl_dns_cache=config.HTTP_DNS_TTL,
+                keepalive_timeout=config.HTTP_KEEPALIVE,
+                enable_cleanup_closed=True
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=3600)  # 1 hour
+            )
+            self._sessions[proxy] = session
+        return session
+
+    def stats(self) -> dict:
+        pools = {}
+        for proxy, session in self._sessions.items():
+            connector = session.connector
+            acquired = getattr(connector, '_acquired', ())
+            idle = getattr(connector, '_conns', {})
+            pools[proxy or 'direct'] = {
+                "active": len(acquired),
+                "idle": sum(len(conns) for conns in idle.values()),
+                "hosts": len(idle),
+                "limit": connector.limit,
+                "limitPerHost": connector.limit_per_host
+            }
+        return {"pools": pools}
+
+# Global instance
+http_sessions = HttpSessionManager()
@@ -0,0 +1,100 @@
+import os
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from src.config import config
+from src.utils.logger import logger
+
+
+class InfoCache:
+    """
+    Extracted yt-dlp info dicts, in-memory LRU backed by sqlite
+
+    Extraction costs several page fetches (and player decoding on
+    YouTube), so a preview followed by a download, or the same link sent
+    twice, should only extract once. Info dicts carry signed media URLs,
+    so every entry expires after a TTL chosen by the caller.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._memory: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS info (
+                    key TEXT PRIMARY KEY,
+                    entry TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+        return self._db
+
+    def get(self, key: str) -> dict | None:
+        """Cached entry for `key`, None if missing or expired"""
+        now = time.time()
+
+        cached = self._memory.get(key)
+        if cached and cached[1] > now:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+
+        row = self.db.execute(
+            "SELECT entry, expires_at FROM info WHERE key = ? AND expires_at > ?",
+            (key, now)
+        ).fetchone()
+        if not row:
+            self._memory.pop(key, None)
+            self.misses += 1
+            return None
+
+        entry = json.loads(row[0])
+        self._remember(key, entry, row[1])
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: dict, ttl: float):
+        expires_at = time.time() + ttl
+        self._remember(key, entry, expires_at)
+        self.db.execute(
+            "INSERT OR REPLACE INTO info (key, entry, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(entry), expires_at)
+        )
+        self.db.execute("DELETE FROM info WHERE expires_at <= ?", (time.time(),))
+
+    def invalidate(self, key: str):
+        self._memory.pop(key, None)
+        self.db.execute("DELETE FROM info WHERE key = ?", (key,))
+        logger.info(f"Info cache invalidated: {key}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "memoryEntries": len(self._memory),
+            "memoryLimit": self.size,
+            "entries": self.db.execute("SELECT COUNT(*) FROM info").fetchone()[0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+    def _remember(self, key: str, entry: dict, expires_at: float):
+        self._memory[key] = (entry, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+# Global instance
+info_cache = InfoCache(config.CACHE_DB, config.INFO_CACHE_SIZE)
@@ -0,0 +1,505 @@
+import asyncio
+import itertools
+import json
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from src.config import config
+from src.services.queue_backend import create_queue_backend
+from src.services.host_limiter import host_limiter
+from src.services.journal import job_journal
+from src.services.proxy_pool import classify_error
+from src.services.storage import StorageFullError
+from src.services.scheduler import FairScheduler, estimate_size
+from src.services.metrics import QUEUE_WAIT, JOBS, JOB_ERRORS, JOBS_IN_FLIGHT, STAGE_IN_FLIGHT, QUEUE_DEPTH
+from src.utils.url_router import url_router
+from src.utils.logger import logger
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue can't accept more jobs"""
+
+
+TIMEOUT_PATTERN = re.compile(r'timed? ?out', re.IGNORECASE)
+
+
+def error_kind(error: BaseException) -> str:
+    """
+    Metrics label of a job failure: timeout, ban, network, too_large, storage or other
+
+    yt-dlp and most pipeline errors reach here as a plain Exception, so
+    the kind comes from the message and the cause chain, not the class.
+    """
+    if isinstance(error, StorageFullError):
+        return 'storage'
+    text = str(error)
+    if 'File too large' in text:
+        return 'too_large'
+    current = error
+    while current is not None:
+        if isinstance(current, asyncio.TimeoutError):
+            return 'timeout'
+        current = current.__cause__ or current.__context__
+    if TIMEOUT_PATTERN.search(text):
+        return 'timeout'
+    kind = classify_error(error)
+    if kind == 'ban':
+        return 'ban'
+    if kind == 'failure':
+        return 'network'
+    return 'other'
+
+
+class Job:
+    """A download request and its progress through the pipeline"""
+
+    def __init__(
+        self,
+        url: str,
+        chat_id: int,
+        message_id: int,
+        user_id: int,
+        file_name: str | None = None,
+        job_id: str | None = None
+    ):
+        self.id = job_id or uuid.uuid4().hex
+        self.url = url
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.user_id = user_id
+        self.file_name = file_name
+
+        # queued -> running -> done / failed
+        self.status = 'queued'
+        self.stage = None
+        self.lane = 'normal'
+        self.size_hint = None  # Expected size, set when scheduled
+
+        # Kept in the journal to resume after a restart
+        self.attempts = 0
+        self.status_message_id = None
+        self.filepath = None  # Finished download
+        self.file_size = None
+        self.result = None
+        self.error = None
+
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def platform(self) -> str:
+        """Metrics label: platform name, or engine for other links"""
+        route = url_router.route(self.url)
+        return route.platform or route.engine
+
+    def to_payload(self) -> dict:
+        """Fields needed to run the job in another process"""
+        return {
+            "id": self.id,
+            "url": self.url,
+            "chatId": self.chat_id,
+            "messageId": self.message_id,
+            "userId": self.user_id,
+            "fileName": self.file_name,
+            "createdAt": self.created_at,
+            # Progress of a replayed job, so the process taking it carries on
+            "attempts": self.attempts,
+            "statusMessageId": self.status_message_id,
+            "filepath": self.filepath,
+            "fileSize": self.file_size
+        }
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> 'Job':
+        job = cls(
+            url=payload["url"],
+            chat_id=payload["chatId"],
+            message_id=payload["messageId"],
+            user_id=payload["userId"],
+            file_name=payload.get("fileName"),
+            job_id=payload["id"]
+        )
+        job.created_at = payload["createdAt"]
+        job.attempts = payload.get("attempts", 0)
+        job.status_message_id = payload.get("statusMessageId")
+        job.filepath = payload.get("filepath")
+        job.file_size = payload.get("fileSize")
+        return job
+
+    @classmethod
+    def from_journal(cls, row: dict) -> 'Job':
+        job = cls.from_payload(json.loads(row["payload"]))
+        job.status = row["status"]
+        job.stage = row["stage"]
+        job.attempts = row["attempts"]
+        job.status_message_id = row["status_message_id"]
+        job.filepath = row["filepath"]
+        job.file_size = row["file_size"]
+        return job
+
+    def to_dict(self) -> dict:
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "url": self.url,
+            "userId": self.user_id,
+            "lane": self.lane,
+            "attempts": self.attempts,
+            "createdAt": int(self.created_at),
+            "startedAt": int(self.started_at) if self.started_at else None,
+            "finishedAt": int(self.finished_at) if self.finished_at else None,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """
+    Bounded job queue served by a fixed pool of workers
+
+    Each pipeline stage (direct download, yt-dlp, upload) has its own
+    concurrency limit, so a burst of jobs can't start more heavy work
+    than the server can handle. The queue itself comes from
+    QUEUE_BACKEND: in-process by default, or shared between worker
+    processes and nodes.
+
+    Up to SCHEDULER_LOOKAHEAD jobs (with a shared queue, only enough for
+    the free workers plus SCHEDULER_SHARED_MARGIN) are taken off the
+    queue, sized (HEAD or yt-dlp info) and handed to a FairScheduler, so
+    one user's backlog doesn't hold up everyone else and small files get
+    through quickly:
+    FAST_LANE_WORKERS workers only ever take small jobs. A dispatcher
+    moves the next fair job to a worker whenever one is free.
+
+    Jobs whose host has no free connection slot are parked with the
+    host limiter instead of holding a worker, and handed to the workers
+    once the host has room, so other sites keep moving.
+
+    Jobs held by this process are written to the job journal on every
+    state change, so the ones a restart or crash interrupts can be
+    replayed (see recover()).
+    """
+
+    STAGES = {
+        'direct': config.DIRECT_CONCURRENCY,
+        'ytdlp': config.YTDLP_CONCURRENCY,
+        'upload': config.UPLOAD_CONCURRENCY,
+    }
+
+    def __init__(self):
+        self._queue = create_queue_backend()
+        self._jobs: dict[str, Job] = {}
+        self._workers: list[asyncio.Task] = []
+        self._dispatcher: asyncio.Task | None = None
+        self._intake: asyncio.Task | None = None
+
+        self._scheduler = FairScheduler()
+        self._sizing = 0  # Taken off the queue, size not known yet
+        self._size_probes = asyncio.Semaphore(config.SIZE_PROBE_CONCURRENCY)
+        self._probes: set[asyncio.Task] = set()
+        self._intake_room = asyncio.Event()
+
+        # (created_at, seq, job) waiting for a worker, parked jobs keep their place
+        self._ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._room = asyncio.Event()
+        self._assigned = 0  # Ready or running
+        self._lane_assigned = {'small': 0, 'normal': 0}
+        self._parked = 0
+        self._parked_total = 0
+        self._detached: set[asyncio.Task] = set()
+        self._handler = None
+
+        self._stage_limits = {name: asyncio.Semaphore(limit) for name, limit in self.STAGES.items()}
+        self._stage_active = {name: 0 for name in self.STAGES}
+
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+        QUEUE_DEPTH.set_function(self.depth)
+
+    async def start(self, handler):
+        """Start worker pool. `handler` is awaited with each Job"""
+        if self._workers:
+            return
+
+        self._handler = handler
+        for i in range(config.JOB_WORKERS):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        self._intake = asyncio.create_task(self._intake_loop())
+
+        logger.info(f"Job workers started: {config.JOB_WORKERS}")
+
+    async def stop(self):
+        """Stop worker pool"""
+        tasks = self._workers + list(self._detached) + list(self._probes)
+        tasks += [task for task in (self._dispatcher, self._intake) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._dispatcher = None
+        self._intake = None
+        await self._queue.close()
+        job_journal.close()
+        logger.info("Job workers stopped")
+
+    @property
+    def shared(self) -> bool:
+        """Whether queued jobs may run in another process"""
+        return self._queue.shared
+
+    async def submit(self, job: Job) -> Job:
+        """Add job to the queue"""
+        self._prune()
+
+        self._jobs[job.id] = job
+        if not self.shared:
+            job_journal.record(job)
+        try:
+            await self._queue.put(job.to_payload())
+        except asyncio.QueueFull:
+            del self._jobs[job.id]
+            job_journal.forget(job.id)
+            raise QueueFullError(f"Job queue is full ({config.JOB_QUEUE_SIZE} jobs)")
+        if self.shared:
+            # Whichever process takes it off the queue journals it
+            job_journal.forget(job.id)
+
+        await self._save(job)
+        logger.info(f"Job queued: {job.id} (queue depth: {self._queue.qsize()})")
+        return job
+
+    def checkpoint(self, job: Job):
+        """Journal the job's progress (stage, status message, downloaded file)"""
+        job_journal.record(job)
+
+    def recover(self) -> list[Job]:
+        """Unfinished jobs of processes that died or restarted, now ours to replay"""
+        jobs = [Job.from_journal(row) for row in job_journal.take_orphans()]
+        if jobs:
+            logger.info(f"Recovered {len(jobs)} unfinished jobs from the journal")
+        return jobs
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    async def lookup(self, job_id: str) -> dict | None:
+        """Job status, also for jobs accepted or run by another process"""
+        job = self._jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        return await self._queue.load(job_id)
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Limit how many jobs run the given stage at once"""
+        async with self._stage_limits[name]:
+            self._stage_active[name] += 1
+            STAGE_IN_FLIGHT.labels(name).inc()
+            try:
+                yield
+            finally:
+                self._stage_active[name] -= 1
+                STAGE_IN_FLIGHT.labels(name).dec()
+
+    def depth(self) -> int:
+        """Jobs accepted but not started: queued, being sized, scheduled, parked or about to start"""
+        return (
+            self._queue.qsize() + self._sizing + len(self._scheduler)
+            + self._parked + self._ready.qsize()
+        )
+
+    def stats(self) -> dict:
+        return {
+            "queueDepth": self.depth(),
+            "queueLimit": config.JOB_QUEUE_SIZE,
+            "parked": self._parked,
+            "parkedTotal": self._parked_total,
+            "scheduler": self._scheduler.stats(),
+            "journal": job_journal.stats(),
+            "workers": len(self._workers),
+            "running": self._running,
+            "completed": self._completed,
+            "failed": self._failed,
+            "stages": {
+                name: {"active": self._stage_active[name], "limit": limit}
+                for name, limit in self.STAGES.items()
+            }
+        }
+
+    def run_detached(self, job: Job, handler) -> Job:
+        """
+        Track a job that runs outside the worker pool
+
+        Used for jobs that only wait on another job's result and would
+        otherwise hold a worker doing nothing.
+        """
+        self._prune()
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._run(job, handler))
+        self._detached.add(task)
+        task.add_done_callback(self._detached.discard)
+        return job
+
+    async def _intake_loop(self):
+        """Take jobs off the queue and size them while there's room for more"""
+        while True:
+            while self._intake_full():
+                self._intake_room.clear()
+                await self._intake_room.wait()
+
+            try:
+                payload = await self._queue.get()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job queue read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            # Same object when this process accepted the job
+            job = self._jobs.get(payload["id"]) or Job.from_payload(payload)
+            self._jobs[job.id] = job
+            job_journal.record(job)
+
+            self._sizing += 1
+            task = asyncio.create_task(self._schedule(job))
+            self._probes.add(task)
+            task.add_done_callback(self._probes.discard)
+
+    def _intake_full(self) -> bool:
+        held = self._sizing + len(self._scheduler)
+        if self.shared:
+            # Leave the rest on the shared queue for processes with free workers
+            return held + self._assigned >= config.JOB_WORKERS + config.SCHEDULER_SHARED_MARGIN
+        return held >= config.SCHEDULER_LOOKAHEAD
+
+    async def _schedule(self, job: Job):
+        """Hand `job` to the fair scheduler once its expected size is known"""
+        size = None
+        try:
+            async with self._size_probes:
+                size = await asyncio.wait_for(estimate_size(job.url), config.SIZE_PROBE_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Size of job {job.id} unknown: {e}")
+        finally:
+            self._sizing -= 1
+
+        self._scheduler.push(job, size)
+        self._room.set()
+
+    async def _dispatch_loop(self):
+        """Move the next fair job to a free worker, parking it if its host is busy"""
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._room.clear()
+                await self._room.wait()
+                continue
+            self._intake_room.set()
+
+            if host_limiter.available(job.url):
+                self._assign(job)
+            else:
+                self._parked += 1
+                self._parked_total += 1
+                logger.info(f"Job parked until its host has room: {job.id}")
+                host_limiter.park(job.url, lambda job=job: self._unpark(job))
+
+    def _next_job(self) -> Job | None:
+        """Next job to start, None while there's no room for one"""
+        if self._assigned >= config.JOB_WORKERS or self._parked >= config.HOST_PARKED_MAX:
+            return None
+        if self._lane_assigned['normal'] < config.JOB_WORKERS - config.FAST_LANE_WORKERS:
+            return self._scheduler.pop()
+        # The remaining workers are kept for small jobs
+        return self._scheduler.pop(lanes=('small',))
+
+    def _assign(self, job: Job):
+        host_limiter.claim(job.url)
+        self._assigned += 1
+        self._lane_assigned[job.lane] += 1
+        self._ready.put_nowait((job.created_at, next(self._seq), job))
+
+    def _unpark(self, job: Job):
+        self._parked -= 1
+        self._assign(job)
+        self._room.set()
+
+    async def _worker(self, index: int):
+        while True:
+            _, _, job = await self._ready.get()
+            waited = time.time() - job.created_at
+            QUEUE_WAIT.labels(job.lane).observe(waited)
+            self._scheduler.record_wait(job.lane, waited)
+            try:
+                await self._run(job, self._handler)
+            finally:
+                self._assigned -= 1
+                self._lane_assigned[job.lane] -= 1
+                self._intake_room.set()
+                host_limiter.unclaim(job.url)
+                self._room.set()
+
+    async def _run(self, job: Job, handler):
+        self._running += 1
+        JOBS_IN_FLIGHT.inc()
+        job.status = 'running'
+        job.started_at = time.time()
+        job_journal.record(job)
+        await self._save(job)
+
+        cancelled = False
+        try:
+            job.result = await handler(job)
+            job.status = 'done'
+            self._completed += 1
+            JOBS.labels(job.platform, 'done').inc()
+        except asyncio.CancelledError:
+            job.status = 'failed'
+            job.error = 'Cancelled'
+            cancelled = True
+            JOBS.labels(job.platform, 'cancelled').inc()
+            raise
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            self._failed += 1
+            JOBS.labels(job.platform, 'failed').inc()
+            JOB_ERRORS.labels(job.platform, error_kind(e)).inc()
+        finally:
+            job.finished_at = time.time()
+            self._running -= 1
+            JOBS_IN_FLIGHT.dec()
+            if not cancelled:
+                # Shutting down leaves the job running in the journal, so it's replayed
+                job_journal.record(job)
+            await self._save(job)
+
+    async def _save(self, job: Job):
+        """Publish job status to other processes (shared queues only)"""
+        try:
+            await self._queue.save(job.id, job.to_dict())
+        except Exception as e:
+            logger.warning(f"Failed to save job {job.id} status: {e}")
+
+    def _prune(self):
+        """Forget finished jobs older than JOB_RESULT_TTL"""
+        cutoff = time.time() - config.JOB_RESULT_TTL
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+# Global instance
+job_manager = JobManager()
@@ -0,0 +1,160 @@
+import os
+import json
+import fcntl
+import sqlite3
+import time
+import uuid
+from src.config import config
+from src.utils.logger import logger
+
+
+class JobJournal:
+    """
+    Crash-safe record of the jobs this process holds, in sqlite (WAL)
+
+    Every state change of a job (queued, running, its stage, status
+    message, downloaded file) is written before the job moves on, and
+    the row is dropped once the job is done or failed. Whatever is left
+    after a crash or restart belongs to a dead process and is replayed.
+
+    Each process owns its rows and holds an flock on a lock file named
+    after its owner id while it runs, so with several uvicorn workers
+    a starting process only takes over rows whose owner's lock is free.
+    """
+
+    FINISHED = ('done', 'failed')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.owner = uuid.uuid4().hex
+        self._db: sqlite3.Connection | None = None
+        self._lock_fd: int | None = None
+
+        self.recorded = 0
+        self.recovered = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # WAL with NORMAL survives a process crash, only power loss can lose the last writes
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    status_message_id INTEGER,
+                    filepath TEXT,
+                    file_size INTEGER,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner)")
+            self._lock_fd = self._hold(self._lock_path(self.owner))
+        return self._db
+
+    def record(self, job):
+        """Write the job's current state (a Job), or drop it once finished"""
+        try:
+            if job.status in self.FINISHED:
+                self.db.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+                return
+            self.db.execute(
+                """
+                INSERT OR REPLACE INTO jobs
+                    (id, owner, payload, status, stage, attempts, status_message_id, filepath, file_size, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job.id, self.owner, json.dumps(job.to_payload()), job.status, job.stage, job.attempts,
+                    job.status_message_id, job.filepath, job.file_size, time.time()
+                )
+            )
+            self.recorded += 1
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to journal job {job.id}: {e}")
+
+    def forget(self, job_id: str):
+        """Drop a job handed to another process (shared queues)"""
+        try:
+            self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to drop job {job_id} from journal: {e}")
+
+    def filepaths(self) -> set[str]:
+        """Downloaded files of unfinished jobs in any process, kept for their replay"""
+        try:
+            rows = self.db.execute("SELECT filepath FROM jobs WHERE filepath IS NOT NULL")
+            return {row['filepath'] for row in rows}
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read journaled files: {e}")
+            return set()
+
+    def take_orphans(self) -> list[dict]:
+        """Take over the unfinished jobs of dead processes, oldest first"""
+        owners = [
+            row['owner'] for row in
+            self.db.execute("SELECT DISTINCT owner FROM jobs WHERE owner != ?", (self.owner,))
+        ]
+        for owner in owners:
+            path = self._lock_path(owner)
+            try:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Owner is still running
+                os.close(fd)
+                continue
+            try:
+                # Only one process gets each row, the others update nothing
+                self.db.execute("UPDATE jobs SET owner = ? WHERE owner = ?", (self.owner, owner))
+                os.remove(path)
+            finally:
+                os.close(fd)
+
+        rows = self.db.execute(
+            "SELECT * FROM jobs WHERE owner = ? ORDER BY updated_at",
+            (self.owner,)
+        ).fetchall()
+        self.recovered += len(rows)
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "recovered": self.recovered
+        }
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            try:
+                os.remove(self._lock_path(self.owner))
+            except OSError:
+                pass
+
+    def _lock_path(self, owner: str) -> str:
+        return os.path.join(os.path.dirname(self.path), f"jobs_{owner}.lock")
+
+    @staticmethod
+    def _hold(path: str) -> int:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+# Global instance
+job_journal = JobJournal(config.JOB_JOURNAL_DB)
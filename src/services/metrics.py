@@ -0,0 +1,97 @@
+import os
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Prometheus metrics, served by GET /metrics
+
+# With several uvicorn workers each process writes its metrics to files in
+# this (empty at start) directory and /metrics merges them, otherwise a
+# scrape only sees the worker that answered. Read by prometheus_client on
+# import, so it must be set in the environment, not only in .env
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Seconds, from sub-second Telegram calls to hour-long downloads
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Bytes per second, 64KB/s .. 512MB/s
+THROUGHPUT_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(8))
+
+QUEUE_WAIT = Histogram(
+    'downloader_queue_wait_seconds',
+    'Time a job waits in the queue before a worker picks it up',
+    ['lane'],
+    buckets=DURATION_BUCKETS
+)
+STAGE_DURATION = Histogram(
+    'downloader_stage_duration_seconds',
+    'Duration of a pipeline stage (download, upload, stream, forward)',
+    ['stage'],
+    buckets=DURATION_BUCKETS
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    'downloader_download_throughput_bytes_per_second',
+    'Throughput of finished downloads',
+    ['engine'],
+    buckets=THROUGHPUT_BUCKETS
+)
+DOWNLOAD_BYTES = Counter(
+    'downloader_download_bytes',
+    'Bytes downloaded',
+    ['engine']
+)
+UPLOAD_BYTES = Counter(
+    'downloader_upload_bytes',
+    'Bytes uploaded to Telegram'
+)
+
+JOBS = Counter(
+    'downloader_jobs',
+    'Finished jobs',
+    ['platform', 'status']
+)
+JOB_ERRORS = Counter(
+    'downloader_job_errors',
+    'Failed jobs by error kind (timeout, ban, network, too_large, storage, other)',
+    ['platform', 'error']
+)
+JOBS_IN_FLIGHT = Gauge(
+    'downloader_jobs_in_flight',
+    'Jobs currently running',
+    multiprocess_mode='livesum'
+)
+STAGE_IN_FLIGHT = Gauge(
+    'downloader_stage_in_flight',
+    'Jobs inside a concurrency-limited stage',
+    ['stage'],
+    multiprocess_mode='livesum'
+)
+QUEUE_DEPTH = Gauge(
+    'downloader_queue_depth',
+    'Jobs waiting in the queue',
+    multiprocess_mode='livesum'
+)
+
+FLOOD_WAITS = Counter(
+    'downloader_telegram_flood_waits',
+    'FloodWait errors from Telegram',
+    ['source']
+)
+FLOOD_WAIT_SECONDS = Counter(
+    'downloader_telegram_flood_wait_seconds',
+    'Seconds Telegram asked us to wait',
+    ['source']
+)
+
+
+def render() -> bytes:
+    """Exposition of this process' metrics, or of all workers' with MULTIPROC_DIR"""
+    if not MULTIPROC_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead():
+    """Drop this process' live gauges from the merged metrics"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,442 @@
+import os
+import time
+import asyncio
+import hashlib
+from telethon.errors import FileReferenceExpiredError
+from src.services.downloader import DownloaderService, PermanentDownloadError
+from src.services.ytdlp import YtDlpService
+from src.services.uploader import uploader
+from src.services.jobs import Job, QueueFullError, job_manager
+from src.services.cache import file_cache
+from src.services.coalescer import Flight, coalescer
+from src.services.status import status_updates
+from src.services.storage import storage_manager
+from src.services.metrics import STAGE_DURATION, DOWNLOAD_BYTES, DOWNLOAD_THROUGHPUT, UPLOAD_BYTES
+from src.utils.logger import logger
+from src.utils.helpers import delete_file, format_bytes, file_sha256
+from src.utils.url_router import url_router
+from src.config import config
+
+def progress_callback(current, total, flight: Flight):
+    """Progress callback for upload"""
+    # Only the latest text is sent, rate limited by the status scheduler
+    percent = (current / total) * 100
+    flight.broadcast(
+        f"⏫ در حال آپلود...\n📊 {percent:.1f}%\n📦 {format_bytes(current)} / {format_bytes(total)}"
+    )
+
+def record_download(engine: str, file_size: int, started: float):
+    """Download metrics, `started` is a time.monotonic() timestamp"""
+    elapsed = time.monotonic() - started
+    STAGE_DURATION.labels('download').observe(elapsed)
+    DOWNLOAD_BYTES.labels(engine).inc(file_size)
+    if elapsed > 0:
+        DOWNLOAD_THROUGHPUT.labels(engine).observe(file_size / elapsed)
+
+def ytdlp_progress(d: dict, flight: Flight):
+    """Progress callback for yt-dlp workers"""
+    if d['status'] != 'downloading':
+        return
+    current = d['downloaded_bytes'] or 0
+    total = d['total_bytes']
+    if total:
+        text = f"⏬ در حال دانلود...\n📊 {current / total * 100:.1f}%\n📦 {format_bytes(current)} / {format_bytes(total)}"
+    else:
+        text = f"⏬ در حال دانلود...\n📦 {format_bytes(current)}"
+    flight.broadcast(text)
+
+async def submit_job(job: Job) -> Job:
+    """Queue job, or attach it to an identical job already in flight"""
+    key = file_cache.url_key(job.url, job.file_name)
+
+    flight = coalescer.get(key)
+    if flight:
+        logger.info(f"Job {job.id} joins in-flight download: {key}")
+        return job_manager.run_detached(job, lambda j: follow_flight(j, flight))
+
+    if job_manager.shared:
+        # Another process may pick the job up, only process_job opens a flight
+        return await job_manager.submit(job)
+
+    coalescer.start(key)
+    try:
+        return await job_manager.submit(job)
+    except Exception as e:
+        coalescer.fail(key, e)
+        raise
+
+async def recover_jobs():
+    """Replay jobs interrupted by a restart or crash, updating their stale status messages"""
+    for job in job_manager.recover():
+        if job.status == 'running':
+            job.attempts += 1
+        if job.attempts > config.JOB_REPLAY_MAX:
+            logger.warning(f"Job {job.id} dropped after {config.JOB_REPLAY_MAX} restarts: {job.url}")
+            fail_recovered(job, "سرور چند بار وسط این کار ری‌استارت شد")
+            continue
+
+        logger.info(f"Replaying job {job.id} ({job.status}, stage {job.stage}): {job.url}")
+        job.status = 'queued'
+        if job.status_message_id:
+            status_updates.update(
+                job.chat_id,
+                job.status_message_id,
+                "🔄 سرور ری‌استارت شد، کار از سر گرفته میشه...\n⏳ در صف..."
+            )
+        try:
+            await submit_job(job)
+        except QueueFullError as e:
+            logger.warning(f"Job {job.id} not replayed: {e}")
+            fail_recovered(job, "صف سرور پره، دوباره امتحان کن")
+
+def fail_recovered(job: Job, reason: str):
+    """Give up on a recovered job: drop it from the journal and tell the user"""
+    job.status = 'failed'
+    job_manager.checkpoint(job)
+    if job.status_message_id:
+        status_updates.update(job.chat_id, job.status_message_id, f"❌ خطا در دانلود:\n{reason}", final=True)
+
+async def open_status(job: Job, text: str) -> int:
+    """Status message of the job: the one from before a restart, or a new one"""
+    if job.status_message_id:
+        status_updates.update(job.chat_id, job.status_message_id, text)
+    else:
+        status_msg = await uploader.send_message(chat_id=job.chat_id, text=text, reply_to=job.message_id)
+        job.status_message_id = status_msg.id
+        job_manager.checkpoint(job)
+    return job.status_message_id
+
+async def follow_flight(job: Job, flight: Flight) -> dict:
+    """Wait for the leading job and deliver its uploaded document"""
+    job.stage = 'waiting'
+    flight.followers += 1
+
+    status_msg_id = await open_status(job, "🔁 این لینک همین الان در حال دانلوده...\n⏳ منتظر بمون...")
+    flight.watch(job.chat_id, status_msg_id)
+
+    try:
+        entry = await asyncio.shield(flight.future)
+
+        job.stage = 'forward'
+        result = await deliver_cached(job, entry)
+        if not result:
+            raise Exception("Backup message is not available")
+
+        status_updates.update(
+            job.chat_id,
+            status_msg_id,
+            f"✅ تکمیل شد!\n📦 {format_bytes(entry['file_size'] or 0)}",
+            final=True
+        )
+        return result
+
+    except Exception as e:
+        logger.error(f"Job failed: {job.id} {str(e)}")
+        status_updates.update(
+            job.chat_id,
+            status_msg_id,
+            f"❌ خطا در دانلود:\n{str(e)[:100]}",
+            final=True
+        )
+        raise
+
+async def deliver_cached(job: Job, entry: dict) -> dict | None:
+    """Send an already uploaded document to the user, None if it's gone"""
+    try:
+        with STAGE_DURATION.labels('forward').time():
+            if entry['document_id'] and entry['access_hash']:
+                await send_by_reference(job, entry)
+            else:
+                # Entries from before references were stored
+                await uploader.forward_message(
+                    to_chat=job.chat_id,
+                    from_chat=config.BACKUP_CHANNEL_ID,
+                    message_id=entry['message_id'],
+                    reply_to=job.message_id
+                )
+    except Exception as e:
+        logger.warning(f"Cached message unusable: {e}")
+        file_cache.invalidate(entry['message_id'])
+        return None
+
+    logger.info(f"Delivered from cache: {job.id} -> message {entry['message_id']}")
+    return {
+        "success": True,
+        "fileSize": entry['file_size'],
+        "fileId": entry['document_id'],
+        "cached": True
+    }
+
+async def send_by_reference(job: Job, entry: dict):
+    """Send the stored document, refreshing its file reference once if expired"""
+    try:
+        await uploader.send_document(
+            to_chat=job.chat_id,
+            document_id=entry['document_id'],
+            access_hash=entry['access_hash'],
+            file_reference=entry['file_reference'] or b'',
+            caption=entry['caption'],
+            reply_to=job.message_id
+        )
+        return
+    except FileReferenceExpiredError:
+        logger.info(f"File reference expired, refreshing: message {entry['message_id']}")
+
+    document = await uploader.get_document(config.BACKUP_CHANNEL_ID, entry['message_id'])
+    if document.id != entry['document_id']:
+        raise Exception(f"Backup message {entry['message_id']} holds another document")
+
+    entry['file_reference'] = document.file_reference
+    file_cache.update_reference(entry['message_id'], document.file_reference)
+
+    await uploader.send_document(
+        to_chat=job.chat_id,
+        document_id=document.id,
+        access_hash=document.access_hash,
+        file_reference=document.file_reference,
+        caption=entry['caption'],
+        reply_to=job.message_id
+    )
+
+async def stream_upload(job: Job, flight: Flight, downloader: DownloaderService) -> tuple | None:
+    """
+    Download and upload at the same time without staging the file on disk
+
+    Returns (backup message, file size, sha256), or None when the link
+    can't be streamed and should go through the regular download.
+    """
+    digest = hashlib.sha256()
+
+    try:
+        async with job_manager.stage('direct'), job_manager.stage('upload'):
+            async with downloader.stream(job.url) as stream:
+                if not stream:
+                    return None
+
+                file_size, chunks, filename = stream
+
+                async def hashed_chunks():
+                    async for chunk in chunks:
+                        digest.update(chunk)
+                        yield chunk
+
+                job.stage = 'upload'
+                started = time.monotonic()
+                flight.broadcast(f"⏬⏫ دانلود و آپلود همزمان...\n📦 حجم: {file_size / 1024 / 1024:.2f} MB")
+
+                backup_msg = await uploader.upload_stream(
+                    chat_id=config.BACKUP_CHANNEL_ID,
+                    chunks=hashed_chunks(),
+                    file_size=file_size,
+                    filename=job.file_name or filename,
+                    caption=f"🔗 {job.url}\n👤 User: {job.user_id}\n📦 {format_bytes(file_size)}",
+                    progress_callback=lambda c, t: progress_callback(c, t, flight)
+                )
+
+        STAGE_DURATION.labels('stream').observe(time.monotonic() - started)
+        DOWNLOAD_BYTES.labels('stream').inc(file_size)
+        UPLOAD_BYTES.inc(file_size)
+    except PermanentDownloadError:
+        raise
+    except Exception as e:
+        logger.warning(f"Streaming failed, falling back to staged download: {e}")
+        job.stage = 'download'
+        return None
+
+    return backup_msg, file_size, digest.hexdigest()
+
+async def process_job(job: Job) -> dict:
+    """Download -> upload to backup channel -> forward to user"""
+
+    logger.info(f"Job started: {job.id} {job.url} for user {job.user_id}")
+
+    key = file_cache.url_key(job.url, job.file_name)
+    flight = coalescer.get(key) or coalescer.start(key)
+
+    try:
+        entry, result = await run_pipeline(job, flight)
+    except BaseException as e:
+        coalescer.fail(key, e)
+        raise
+
+    coalescer.finish(key, entry)
+    return result
+
+async def run_pipeline(job: Job, flight: Flight) -> tuple[dict, dict]:
+    """Returns backup message entry (shared with waiting jobs) and job result"""
+
+    filepath = None
+    status_msg_id = None
+    interrupted = False
+    # Disk space for the downloaded file, held until it's deleted
+    reservation = storage_manager.reservation()
+
+    # Already delivered before? Skip straight to forwarding
+    cached = file_cache.get(job.url, job.file_name)
+    if cached:
+        job.stage = 'forward'
+        result = await deliver_cached(job, cached)
+        if result:
+            if job.status_message_id:
+                # Uploaded before a restart, the old status message is still open
+                status_updates.update(
+                    job.chat_id,
+                    job.status_message_id,
+                    f"✅ تکمیل شد!\n📦 {format_bytes(cached['file_size'] or 0)}",
+                    final=True
+                )
+            return cached, result
+
+    try:
+        # Send status
+        status_msg_id = await open_status(job, "🚀 سرور شروع به کار کرد...\n⏬ در حال دانلود...")
+        flight.watch(job.chat_id, status_msg_id)
+
+        # Determine download method
+        route = url_router.route(job.url)
+        job.stage = 'download'
+        backup_msg = None
+
+        if job.filepath and os.path.exists(job.filepath) and os.path.getsize(job.filepath) == job.file_size:
+            # Downloaded before a restart
+            logger.info(f"Resuming with downloaded file: {job.filepath}")
+            filepath = job.filepath
+            await reservation.reserve(job.file_size)
+
+        elif route.engine == 'platform':
+            logger.info("Using yt-dlp")
+            flight.broadcast("🎵 دانلود از پلتفرم...\n⏳ این کار ممکنه چند دقیقه طول بکشه...")
+
+            async with job_manager.stage('ytdlp'):
+                started = time.monotonic()
+                ytdlp = YtDlpService()
+                filepath = await ytdlp.download(
+                    job.url,
+                    job.file_name,
+                    progress_callback=lambda d: ytdlp_progress(d, flight),
+                    reservation=reservation
+                )
+                record_download('ytdlp', os.path.getsize(filepath), started)
+        else:
+            logger.info("Using direct download")
+            downloader = DownloaderService()
+
+            if config.STREAM_UPLOAD and route.engine == 'direct':
+                streamed = await stream_upload(job, flight, downloader)
+                if streamed:
+                    backup_msg, file_size, sha256 = streamed
+
+            if not backup_msg:
+                async with job_manager.stage('direct'):
+                    started = time.monotonic()
+                    filepath = await downloader.download(job.url, reservation=reservation)
+                    record_download(downloader.engine, os.path.getsize(filepath), started)
+
+        if not backup_msg:
+            # Get file size
+            file_size = os.path.getsize(filepath)
+
+            logger.info(f"Download complete: {format_bytes(file_size)}")
+            # May wait a long time for an upload slot, the sweeper must leave it
+            reservation.protect(filepath)
+            if job.filepath != filepath:
+                job.filepath, job.file_size = filepath, file_size
+                job_manager.checkpoint(job)
+
+            # Same content already uploaded from another URL?
+            sha256 = await file_sha256(filepath)
+            cached = file_cache.get_by_hash(sha256, job.file_name)
+            if cached:
+                job.stage = 'forward'
+                result = await deliver_cached(job, cached)
+                if result:
+                    file_cache.alias(job.url, cached, job.file_name)
+                    status_updates.update(
+                        job.chat_id,
+                        status_msg_id,
+                        f"✅ تکمیل شد!\n📦 {file_size / 1024 / 1024:.2f} MB",
+                        final=True
+                    )
+                    return cached, result
+
+            # Update status
+            flight.broadcast(
+                f"✅ دانلود تمام شد!\n📦 حجم: {file_size / 1024 / 1024:.2f} MB\n⏫ شروع آپلود به تلگرام..."
+            )
+
+            # Determine filename
+            final_filename = job.file_name if job.file_name else os.path.basename(filepath)
+
+            # Upload to backup channel with progress
+            job.stage = 'upload'
+            async with job_manager.stage('upload'):
+                # prometheus' Timer is a sync context manager only
+                with STAGE_DURATION.labels('upload').time():
+                    backup_msg = await uploader.upload_document(
+                        chat_id=config.BACKUP_CHANNEL_ID,
+                        filepath=filepath,
+                        filename=final_filename,
+                        caption=f"🔗 {job.url}\n👤 User: {job.user_id}\n📦 {format_bytes(file_size)}",
+                        progress_callback=lambda c, t: progress_callback(c, t, flight)
+                    )
+
+            UPLOAD_BYTES.inc(file_size)
+            logger.info(f"Uploaded to backup channel")
+
+        file_size_mb = file_size / 1024 / 1024
+        entry = file_cache.put(job.url, backup_msg, sha256=sha256, file_name=job.file_name)
+
+        # Update status
+        flight.broadcast(f"✅ آپلود تمام شد!\n📤 در حال ارسال به شما...")
+
+        # Send to user straight from the upload's document reference
+        job.stage = 'forward'
+        job_manager.checkpoint(job)
+        with STAGE_DURATION.labels('forward').time():
+            await send_by_reference(job, entry)
+
+        # Final status
+        status_updates.update(
+            job.chat_id,
+            status_msg_id,
+            f"✅ تکمیل شد!\n📦 {file_size_mb:.2f} MB",
+            final=True
+        )
+
+        logger.info(f"Job completed successfully: {job.id} {job.url}")
+
+        return entry, {
+            "success": True,
+            "fileSize": file_size,
+            "fileId": backup_msg.document.id
+        }
+
+    except Exception as e:
+        logger.error(f"Job failed: {job.id} {str(e)}", exc_info=True)
+
+        # Notify user
+        if status_msg_id:
+            error_msg = str(e)
+            if len(error_msg) > 100:
+                error_msg = error_msg[:100] + "..."
+
+            status_updates.update(
+                job.chat_id,
+                status_msg_id,
+                f"❌ خطا در دانلود:\n{error_msg}\n\n💡 نکات:\n• اگه لینک نیاز به لاگین داره، cookies.txt رو اضافه کن\n• برخی سایت‌ها ممکنه VPN نیاز داشته باشن",
+                final=True
+            )
+
+        raise
+
+    except asyncio.CancelledError:
+        # Shutting down: keep the download for the replay
+        interrupted = True
+        raise
+
+    finally:
+        # Cleanup
+        if filepath and os.path.exists(filepath) and not interrupted:
+            await delete_file(filepath)
+            logger.debug(f"Cleaned up: {filepath}")
+        reservation.release()
@@ -0,0 +1,85 @@
+from src.config import config
+from src.utils.logger import logger
+
+
+class PostprocessPolicy:
+    """
+    Picks yt-dlp postprocessing that avoids needless ffmpeg transcodes
+
+    Decides from the formats yt-dlp selected during extraction: audio
+    that Telegram already plays is kept as-is (at most remuxed), and
+    merged video goes into a container that takes both streams with a
+    plain stream copy. Only audio in other codecs is transcoded.
+    """
+
+    # Audio codec families that need no transcode
+    AUDIO_PASSTHROUGH = {'mp3', 'mp4a', 'aac', 'opus', 'vorbis', 'flac', 'alac'}
+
+    # Codec families MP4 holds with a stream copy
+    MP4_VIDEO = {'avc1', 'avc3', 'h264', 'hvc1', 'hev1', 'h265', 'av01'}
+    MP4_AUDIO = {'mp4a', 'aac', 'mp3', 'opus', 'flac', 'alac'}
+
+    def __init__(self):
+        self.passthrough = 0
+        self.transcoded = 0
+
+    def apply(self, opts: dict, info: dict) -> dict:
+        """Return a copy of yt-dlp `opts` adjusted to the selected formats of `info`"""
+        opts = dict(opts)
+        video_codec, audio_codec = self._selected_codecs(info)
+
+        postprocessors = []
+        for pp in opts.get('postprocessors', []):
+            if pp.get('key') == 'FFmpegExtractAudio':
+                pp = self._extract_audio(pp, audio_codec)
+            postprocessors.append(pp)
+        if postprocessors:
+            opts['postprocessors'] = postprocessors
+
+        if opts.get('merge_output_format') == 'mp4' and info.get('requested_formats'):
+            if video_codec not in self.MP4_VIDEO or (audio_codec and audio_codec not in self.MP4_AUDIO):
+                # MKV takes any codec pair without re-encoding
+                logger.info(f"Merging {video_codec}+{audio_codec} into mkv instead of mp4")
+                opts['merge_output_format'] = 'mkv'
+
+        # Keep every ffmpeg run from taking all cores
+        opts['postprocessor_args'] = {
+            **opts.get('postprocessor_args', {}),
+            'ffmpeg': ['-threads', str(config.FFMPEG_THREADS)]
+        }
+        return opts
+
+    def stats(self) -> dict:
+        return {
+            "audioPassthrough": self.passthrough,
+            "audioTranscoded": self.transcoded
+        }
+
+    def _extract_audio(self, pp: dict, audio_codec: str | None) -> dict:
+        if audio_codec in self.AUDIO_PASSTHROUGH:
+            # 'best' keeps the source codec: skip or stream copy into its own container
+            self.passthrough += 1
+            logger.info(f"Audio is {audio_codec}, keeping it without transcoding")
+            return {**pp, 'preferredcodec': 'best'}
+
+        self.transcoded += 1
+        logger.info(f"Audio is {audio_codec or 'unknown'}, transcoding to {pp.get('preferredcodec')}")
+        return pp
+
+    @staticmethod
+    def _codec_family(codec: str | None) -> str | None:
+        if not codec or codec == 'none':
+            return None
+        return codec.split('.')[0].lower()
+
+    def _selected_codecs(self, info: dict) -> tuple[str | None, str | None]:
+        """(video, audio) codec families of the formats yt-dlp will download"""
+        formats = info.get('requested_formats') or [info]
+        video_codec = audio_codec = None
+        for fmt in formats:
+            video_codec = video_codec or self._codec_family(fmt.get('vcodec'))
+            audio_codec = audio_codec or self._codec_family(fmt.get('acodec'))
+        return video_codec, audio_codec
+
+# Global instance
+postprocess_policy = PostprocessPolicy()
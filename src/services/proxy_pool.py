@@ -0,0 +1,326 @@
+import asyncio
+import random
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import aiohttp
+from src.config import config
+from src.services.http import http_sessions
+from src.utils.logger import logger
+from src.utils.url_router import host_of
+
+
+# Target refused the proxy's IP: rate limits, blocks, geo restrictions
+BAN_PATTERN = re.compile(
+    r'HTTP (?:Error )?(?:403|429)\b|geo.?restrict|not available (?:in|from) your (?:country|location)',
+    re.IGNORECASE
+)
+# Proxy or network trouble in yt-dlp / wrapped error messages
+NETWORK_PATTERN = re.compile(
+    r'timed? ?out|unable to connect|connection (?:refused|reset|aborted)|cannot connect|'
+    r'proxy|tunnel|ssl|name resolution|unreachable|HTTP (?:Error )?(?:502|503|504)\b',
+    re.IGNORECASE
+)
+
+# Size used to weigh latency against throughput when scoring
+REFERENCE_SIZE = 10 * 1024 * 1024
+
+EWMA_ALPHA = 0.3
+
+
+def classify_error(error: BaseException) -> str | None:
+    """'ban', 'failure' (the proxy's fault) or None (the target's or ours)"""
+    text = str(error)
+    if BAN_PATTERN.search(text):
+        return 'ban'
+
+    # Wrapped errors keep the original as their cause or context
+    current = error
+    while current is not None:
+        if isinstance(current, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return 'failure'
+        current = current.__cause__ or current.__context__
+
+    if NETWORK_PATTERN.search(text):
+        return 'failure'
+    return None
+
+
+def _ewma(current: float | None, sample: float) -> float:
+    if current is None:
+        return sample
+    return current + EWMA_ALPHA * (sample - current)
+
+
+class ProxyScore:
+    """Moving averages of how a proxy performs (overall or for one domain)"""
+
+    def __init__(self):
+        self.latency: float | None = None  # Seconds to first response
+        self.throughput: float | None = None  # Bytes per second
+        self.success = 1.0  # Success rate
+        self.requests = 0
+        self.errors = 0
+        self.bans = 0
+        self.banned_until = 0.0
+
+    def record_success(self, latency: float | None, size: int, seconds: float):
+        self.requests += 1
+        self.success = _ewma(self.success, 1.0)
+        if latency is not None:
+            self.latency = _ewma(self.latency, latency)
+        if size and seconds > 0:
+            self.throughput = _ewma(self.throughput, size / seconds)
+
+    def record_failure(self):
+        self.requests += 1
+        self.errors += 1
+        self.success = _ewma(self.success, 0.0)
+
+    def value(self, fallback: 'ProxyScore | None' = None) -> float:
+        """Higher is better: success rate over expected time for a reference download"""
+        latency = self.latency if self.latency is not None else (fallback and fallback.latency)
+        throughput = self.throughput if self.throughput is not None else (fallback and fallback.throughput)
+        cost = (latency or 1.0) + (REFERENCE_SIZE / throughput if throughput else 1.0)
+        return self.success / cost
+
+    def stats(self) -> dict:
+        return {
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "throughput": int(self.throughput) if self.throughput is not None else None,
+            "success": round(self.success, 3),
+            "requests": self.requests,
+            "errors": self.errors,
+            "bans": self.bans
+        }
+
+
+class Proxy:
+    """One PROXY_LIST entry with its circuit breaker"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.score = ProxyScore()
+        self.domains: OrderedDict[str, ProxyScore] = OrderedDict()
+
+        # closed -> open (cooling down) -> half-open (next result decides) -> closed
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = config.PROXY_COOLDOWN
+        self.trips = 0
+
+    @property
+    def label(self) -> str:
+        """URL without credentials, for logs and stats"""
+        parts = urlsplit(self.url)
+        return f"{parts.scheme}://{parts.hostname}:{parts.port}" if parts.hostname else self.url
+
+    def domain(self, domain: str, create: bool = False) -> ProxyScore | None:
+        score = self.domains.get(domain)
+        if score is None and create:
+            score = self.domains[domain] = ProxyScore()
+            while len(self.domains) > config.PROXY_DOMAIN_STATS:
+                self.domains.popitem(last=False)
+        elif score is not None:
+            self.domains.move_to_end(domain)
+        return score
+
+    def usable(self, domain: str, now: float) -> bool:
+        if now < self.open_until:
+            return False
+        score = self.domains.get(domain)
+        return score is None or now >= score.banned_until
+
+    def state(self, now: float) -> str:
+        if now < self.open_until:
+            return 'open'
+        if self.consecutive_failures >= config.PROXY_FAILURE_THRESHOLD:
+            return 'half-open'
+        return 'closed'
+
+    def fail(self, now: float):
+        """
+        Count a failure, opening the circuit at the threshold
+
+        The count isn't reset by opening, so once the cooldown is over a
+        single further failure opens it again, for twice as long.
+        """
+        self.score.record_failure()
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= config.PROXY_FAILURE_THRESHOLD:
+            self.open_until = now + self.cooldown
+            self.trips += 1
+            logger.warning(
+                f"Proxy {self.label} failed {self.consecutive_failures} times, "
+                f"cooling down for {self.cooldown:.0f}s"
+            )
+            self.cooldown = min(self.cooldown * 2, config.PROXY_COOLDOWN_MAX)
+
+    def close(self):
+        if self.consecutive_failures >= config.PROXY_FAILURE_THRESHOLD:
+            logger.info(f"Proxy {self.label} recovered")
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = config.PROXY_COOLDOWN
+
+
+class ProxyPool:
+    """
+    Picks the best proxy from PROXY_LIST for each target domain
+
+    Every download reports back its latency and throughput, or the kind
+    of error it hit. Network errors count against the proxy itself:
+    PROXY_FAILURE_THRESHOLD in a row open its circuit breaker for a
+    cooldown that doubles on each trip, after which one trial request
+    decides whether it's back. Bans (403/429, geo blocks) only bench the
+    proxy for that domain. A background probe keeps latency current and
+    brings broken proxies back without risking real jobs.
+    """
+
+    def __init__(self, proxies: list[str]):
+        self._proxies = {url: Proxy(url) for url in dict.fromkeys(proxies)}
+        self._prober: asyncio.Task | None = None
+        self.probes = 0
+
+    async def start(self):
+        if self._proxies and not self._prober:
+            self._prober = asyncio.create_task(self._probe_loop())
+            logger.info(f"Proxy pool: {len(self._proxies)} proxies")
+
+    async def stop(self):
+        if self._prober:
+            self._prober.cancel()
+            await asyncio.gather(self._prober, return_exceptions=True)
+            self._prober = None
+
+    def choose(self, url: str) -> str | None:
+        """Proxy to use for `url`, None when PROXY_LIST is empty"""
+        if not self._proxies:
+            return None
+
+        domain = host_of(url)
+        now = time.monotonic()
+        usable = [proxy for proxy in self._proxies.values() if proxy.usable(domain, now)]
+        if not usable:
+            # Everything is cooling down, the one that's back first gets a trial
+            proxy = min(
+                self._proxies.values(),
+                key=lambda p: max(p.open_until, p.domains[domain].banned_until if domain in p.domains else 0)
+            )
+            logger.warning(f"No healthy proxy for {domain}, trying {proxy.label}")
+            return proxy.url
+
+        if len(usable) > 1 and random.random() < config.PROXY_EXPLORE:
+            # Keep some traffic on the others so their scores stay current
+            return random.choice(usable).url
+
+        def score(proxy: Proxy) -> float:
+            domain_score = proxy.domain(domain)
+            if domain_score:
+                return domain_score.value(proxy.score)
+            return proxy.score.value()
+
+        return max(usable, key=score).url
+
+    def usable(self, proxy_url: str | None, url: str) -> bool:
+        """Whether `proxy_url` may still be used for `url` (e.g. one stored with cached info)"""
+        proxy = self._proxies.get(proxy_url)
+        return proxy is None or proxy.usable(host_of(url), time.monotonic())
+
+    def has_alternative(self, proxy_url: str | None, url: str) -> bool:
+        """Whether a proxy other than `proxy_url` may still be used for `url`"""
+        domain = host_of(url)
+        now = time.monotonic()
+        return any(
+            proxy.url != proxy_url and proxy.usable(domain, now)
+            for proxy in self._proxies.values()
+        )
+
+    def record_success(
+        self,
+        proxy_url: str | None,
+        url: str,
+        latency: float | None = None,
+        size: int = 0,
+        seconds: float = 0.0
+    ):
+        proxy = self._proxies.get(proxy_url)
+        if not proxy:
+            return
+        proxy.score.record_success(latency, size, seconds)
+        proxy.domain(host_of(url), create=True).record_success(latency, size, seconds)
+        proxy.close()
+
+    def record_error(self, proxy_url: str | None, url: str, error: BaseException, kind: str | None = None):
+        """Count `error` against the proxy if it's a ban or the proxy's fault"""
+        proxy = self._proxies.get(proxy_url)
+        if not proxy:
+            return
+
+        kind = kind or classify_error(error)
+        now = time.monotonic()
+        if kind == 'ban':
+            domain = host_of(url)
+            score = proxy.domain(domain, create=True)
+            score.bans += 1
+            proxy.score.bans += 1
+            score.record_failure()
+            score.banned_until = now + config.PROXY_BAN_COOLDOWN
+            logger.warning(f"Proxy {proxy.label} banned by {domain}: {str(error)[:100]}")
+        elif kind == 'failure':
+            proxy.domain(host_of(url), create=True).record_failure()
+            proxy.fail(now)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "probes": self.probes,
+            "proxies": [
+                {
+                    "proxy": proxy.label,
+                    "state": proxy.state(now),
+                    "cooldownLeft": max(int(proxy.open_until - now), 0),
+                    "trips": proxy.trips,
+                    **proxy.score.stats(),
+                    "bannedBy": [
+                        domain for domain, score in proxy.domains.items()
+                        if score.banned_until > now
+                    ]
+                }
+                for proxy in self._proxies.values()
+            ]
+        }
+
+    async def _probe(self, proxy: Proxy):
+        """Fetch PROXY_PROBE_URL through the proxy, any answer below 500 counts as alive"""
+        started = time.monotonic()
+        try:
+            session = http_sessions.get(proxy.url)
+            timeout = aiohttp.ClientTimeout(total=config.PROXY_PROBE_TIMEOUT)
+            async with session.get(config.PROXY_PROBE_URL, proxy=proxy.url, timeout=timeout) as response:
+                await response.read()
+                if response.status >= 500:
+                    raise Exception(f"Probe got HTTP {response.status}")
+        except Exception as e:
+            # Failing probes of an open proxy don't stretch its cooldown
+            if started >= proxy.open_until:
+                logger.warning(f"Proxy {proxy.label} probe failed: {e}")
+                proxy.fail(time.monotonic())
+            return
+
+        # Probe latency only feeds the overall score, domains keep real traffic
+        proxy.score.latency = _ewma(proxy.score.latency, time.monotonic() - started)
+        proxy.close()
+
+    async def _probe_loop(self):
+        while True:
+            try:
+                await asyncio.gather(*[self._probe(proxy) for proxy in self._proxies.values()])
+                self.probes += 1
+            except Exception as e:
+                logger.error(f"Proxy probe failed: {e}")
+            await asyncio.sleep(config.PROXY_PROBE_INTERVAL)
+
+# Global instance
+proxy_pool = ProxyPool(config.PROXY_LIST)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+from src.config import config
+from src.utils.logger import logger
+
+
+class MemoryQueue:
+    """
+    In-process job queue (default)
+
+    Only the process that accepted a job can run it or report its
+    status, so with several uvicorn workers each one has its own queue.
+    """
+
+    shared = False
+
+    def __init__(self, maxsize: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def put(self, payload: dict):
+        """Raises asyncio.QueueFull when the queue is at its limit"""
+        self._queue.put_nowait(payload)
+
+    async def get(self) -> dict:
+        payload = await self._queue.get()
+        self._queue.task_done()
+        return payload
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def save(self, job_id: str, state: dict):
+        pass
+
+    async def load(self, job_id: str) -> dict | None:
+        return None
+
+    async def close(self):
+        pass
+
+
+class RedisQueue:
+    """
+    Job queue and job status shared by every worker process and node
+
+    Jobs are JSON payloads in a Redis list (LPUSH / BRPOP), so any worker
+    with a free slot takes the next job. Status is kept under a key per
+    job for JOB_RESULT_TTL, so GET /jobs/{id} works on any worker.
+    """
+
+    shared = True
+
+    # Push only while the list is below the limit, atomically
+    PUSH_SCRIPT = """
+    if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+        return -1
+    end
+    return redis.call('LPUSH', KEYS[1], ARGV[1])
+    """
+
+    def __init__(self, url: str, maxsize: int, prefix: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("QUEUE_BACKEND=redis needs the redis package (pip install 'redis>=5')")
+
+        self._redis = redis.from_url(url)
+        self._maxsize = maxsize
+        self._queue_key = f"{prefix}:queue"
+        self._job_prefix = f"{prefix}:job:"
+        self._push = self._redis.register_script(self.PUSH_SCRIPT)
+        self._depth = 0
+
+    async def put(self, payload: dict):
+        """Raises asyncio.QueueFull when the queue is at its limit"""
+        depth = await self._push(keys=[self._queue_key], args=[json.dumps(payload), self._maxsize])
+        if depth < 0:
+            raise asyncio.QueueFull()
+        self._depth = depth
+
+    async def get(self) -> dict:
+        _, data = await self._redis.brpop(self._queue_key, timeout=0)
+        self._depth = await self._redis.llen(self._queue_key)
+        return json.loads(data)
+
+    def qsize(self) -> int:
+        """Depth seen by the last put/get of this process"""
+        return self._depth
+
+    async def save(self, job_id: str, state: dict):
+        await self._redis.set(self._job_prefix + job_id, json.dumps(state), ex=config.JOB_RESULT_TTL)
+
+    async def load(self, job_id: str) -> dict | None:
+        data = await self._redis.get(self._job_prefix + job_id)
+        return json.loads(data) if data else None
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_queue_backend():
+    """Queue backend picked by QUEUE_BACKEND"""
+    if config.QUEUE_BACKEND == 'redis':
+        logger.info(f"Job queue: redis ({config.QUEUE_PREFIX})")
+        return RedisQueue(config.REDIS_URL, config.JOB_QUEUE_SIZE, config.QUEUE_PREFIX)
+    if config.QUEUE_BACKEND != 'memory':
+        raise ValueError(f"Unknown QUEUE_BACKEND: {config.QUEUE_BACKEND}")
+    return MemoryQueue(config.JOB_QUEUE_SIZE)
@@ -0,0 +1,192 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+import aiohttp
+from src.config import config
+from src.services.http import http_sessions
+from src.services.proxy_pool import proxy_pool
+from src.services.host_limiter import host_limiter, parse_retry_after
+from src.services.ytdlp import YtDlpService
+from src.services.ytdlp_pool import ytdlp_pool
+from src.utils.logger import logger
+from src.utils.url_router import url_router
+from src.utils.helpers import get_random_user_agent
+
+
+LANES = ('small', 'normal')
+
+# Recent queue waits kept per lane for percentiles
+WAIT_SAMPLES = 1000
+
+# Smallest cost a job is charged, so tiny files still take turns
+MIN_COST = 1024 * 1024
+
+# yt-dlp extractions started to size a job, at most one at a time
+_extractions: set[asyncio.Task] = set()
+
+
+async def estimate_size(url: str) -> int | None:
+    """Expected download size from a HEAD request or yt-dlp info, None if unknown"""
+    route = url_router.route(url)
+    if route.engine == 'direct':
+        return await _head_size(url)
+    if route.engine in ('platform', 'video') and config.SIZE_PROBE_YTDLP:
+        info = await _ytdlp_info(url)
+        if info is None:
+            return None
+        formats = info.get('requested_formats') or [info]
+        sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+        return sum(sizes) if all(sizes) else None
+    return None
+
+
+async def _ytdlp_info(url: str) -> dict | None:
+    """
+    Info from the extraction cache, or a fresh extraction if the pool is idle
+
+    Extraction shares the yt-dlp pool with downloads, so it's skipped
+    while downloads need the workers. Running out of time only stops
+    the wait: the extraction finishes in the background and fills the
+    cache for the download, instead of a cancel killing the worker.
+    """
+    service = YtDlpService()
+    info = service.cached_info(url)
+    if info is not None or _extractions or ytdlp_pool.saturated:
+        return info
+
+    task = asyncio.create_task(service.get_info(url))
+    _extractions.add(task)
+    task.add_done_callback(_extraction_done)
+    # The job manager's SIZE_PROBE_TIMEOUT cancels the wait, not the extraction
+    info, _ = await asyncio.shield(task)
+    return info
+
+
+def _extraction_done(task: asyncio.Task):
+    _extractions.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.info(f"Size probe extraction failed: {task.exception()}")
+
+
+async def _head_size(url: str) -> int | None:
+    proxy = proxy_pool.choose(url)
+    session = http_sessions.get(proxy)
+    headers = {'User-Agent': get_random_user_agent()}
+    try:
+        async with host_limiter.slot(url):
+            started = time.monotonic()
+            async with session.head(url, headers=headers, proxy=proxy, allow_redirects=True) as response:
+                if response.status in (429, 503):
+                    host_limiter.throttle(url, parse_retry_after(response.headers.get('retry-after')))
+                    return None
+                length = response.headers.get('content-length') if response.status == 200 else None
+    except aiohttp.ClientError as e:
+        proxy_pool.record_error(proxy, url, e)
+        raise
+    proxy_pool.record_success(proxy, url, latency=time.monotonic() - started)
+    return int(length) if length and length.isdigit() else None
+
+
+class UserQueue:
+    """Waiting jobs of one user, per lane, and the user's virtual finish time"""
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = 0.0
+        self.lanes: dict[str, deque] = {lane: deque() for lane in LANES}
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self.lanes.values())
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of jobs between users
+
+    Each job is charged its expected size divided by the user's weight
+    (USER_WEIGHTS, default 1) and gets a virtual finish tag after the
+    user's previous one, so a user with twenty big files is served in
+    turn with everyone else instead of ahead of them. The job with the
+    lowest tag goes next; small jobs have small tags and overtake big
+    ones. Jobs up to SMALL_JOB_SIZE also go to the 'small' lane, which
+    the job manager keeps some workers free for.
+    """
+
+    def __init__(self):
+        self._users: dict[int, UserQueue] = {}
+        self._virtual = 0.0
+        self._seq = itertools.count()
+        self._size = 0
+
+        self.queued = {lane: 0 for lane in LANES}
+        self.waits = {lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES}
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def lane_of(size: int | None) -> str:
+        return 'small' if size is not None and size <= config.SMALL_JOB_SIZE else 'normal'
+
+    def push(self, job, size: int | None):
+        """Queue `job` (a Job) with its expected size in bytes"""
+        user = self._users.get(job.user_id)
+        if user is None:
+            user = self._users[job.user_id] = UserQueue(config.USER_WEIGHTS.get(job.user_id, 1.0))
+
+        job.size_hint = size
+        job.lane = self.lane_of(size)
+        user.finish = max(self._virtual, user.finish) + self._cost(job, user)
+        user.lanes[job.lane].append((user.finish, next(self._seq), job))
+
+        self._size += 1
+        self.queued[job.lane] += 1
+
+    def pop(self, lanes=LANES):
+        """Job with the lowest finish tag in `lanes`, None if there's none"""
+        best = None
+        for user_id, user in self._users.items():
+            for lane in lanes:
+                if user.lanes[lane] and (best is None or user.lanes[lane][0] < best[0]):
+                    best = (user.lanes[lane][0], user_id, lane)
+        if best is None:
+            return None
+
+        (finish, _, job), user_id, lane = best
+        user = self._users[user_id]
+        user.lanes[lane].popleft()
+        # Virtual time follows the service, so a user coming back later
+        # doesn't get credit for the time they had nothing queued
+        self._virtual = max(self._virtual, finish - self._cost(job, user))
+        if not len(user):
+            del self._users[user_id]
+        self._size -= 1
+        return job
+
+    def record_wait(self, lane: str, seconds: float):
+        self.waits[lane].append(seconds)
+
+    def stats(self) -> dict:
+        lanes = {}
+        for lane in LANES:
+            waits = sorted(self.waits[lane])
+            lanes[lane] = {
+                "waiting": sum(len(user.lanes[lane]) for user in self._users.values()),
+                "queuedTotal": self.queued[lane],
+                "waitP50": round(_percentile(waits, 0.5), 2),
+                "waitP95": round(_percentile(waits, 0.95), 2),
+                "waitMax": round(waits[-1], 2) if waits else 0.0
+            }
+        return {"users": len(self._users), "lanes": lanes}
+
+    @staticmethod
+    def _cost(job, user: UserQueue) -> float:
+        size = job.size_hint if job.size_hint is not None else config.DEFAULT_JOB_SIZE
+        return max(size, MIN_COST) / user.weight
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from telethon.errors import FloodWaitError
+from src.services.uploader import uploader
+from src.config import config
+from src.services.metrics import FLOOD_WAITS, FLOOD_WAIT_SECONDS
+from src.utils.logger import logger
+
+
+class TokenBucket:
+    """Allows `rate` operations per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class StatusScheduler:
+    """
+    Sends status message edits off the job's hot path
+
+    Jobs only record the latest text for a message, so edits that pile up
+    while a chat is rate limited collapse into one. A background task
+    sends them under per-chat and global token buckets and pauses
+    everything for the duration of a FloodWait.
+    """
+
+    def __init__(self):
+        # (chat_id, message_id) -> (text, final), oldest first
+        self._pending: dict[tuple[int, int], tuple[str, bool]] = {}
+        self._sending: set[tuple[int, int]] = set()
+        self._last_sent: dict[tuple[int, int], str] = {}
+
+        self._global = TokenBucket(config.STATUS_GLOBAL_RATE, config.STATUS_GLOBAL_RATE)
+        self._chats: dict[int, TokenBucket] = {}
+        self._flood_until = 0.0
+
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._send_tasks: set[asyncio.Task] = set()
+
+        self.sent = 0
+        self.coalesced = 0
+        self.flood_waits = 0
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Status scheduler started")
+
+    async def stop(self):
+        if self._task:
+            tasks = [self._task, *self._send_tasks]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._task = None
+            logger.info("Status scheduler stopped")
+
+    def update(self, chat_id: int, message_id: int, text: str, final: bool = False):
+        """
+        Set the text a status message should show
+
+        `final` marks the last update of a message; its bookkeeping is
+        dropped once it's sent.
+        """
+        key = (chat_id, message_id)
+        if key not in self._pending and self._last_sent.get(key) == text:
+            if final:
+                self._last_sent.pop(key, None)
+            return
+
+        pending = self._pending.get(key)
+        if pending:
+            if pending[1] and not final:
+                # A final text must not be replaced by a late progress update
+                return
+            self.coalesced += 1
+        self._pending[key] = (text, final)
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "sending": len(self._sending),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "floodWaits": self.flood_waits,
+            "floodWaitRemaining": max(0, round(self._flood_until - time.monotonic(), 1))
+        }
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(config.STATUS_CHAT_RATE, config.STATUS_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _sleep(self, seconds: float):
+        """Sleep, but wake up early for new updates"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._prune_buckets()
+                await self._sleep(60)
+                continue
+
+            now = time.monotonic()
+            if now < self._flood_until:
+                await asyncio.sleep(self._flood_until - now)
+                continue
+
+            wait = self._global.wait_time(now)
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            key = None
+            wait = 60.0
+            for candidate in self._pending:
+                if candidate in self._sending:
+                    continue
+                chat_wait = self._bucket(candidate[0]).wait_time(now)
+                if not chat_wait:
+                    key = candidate
+                    break
+                wait = min(wait, chat_wait)
+
+            if key is None:
+                await self._sleep(wait)
+                continue
+
+            text, final = self._pending.pop(key)
+            self._global.take(now)
+            self._bucket(key[0]).take(now)
+            self._sending.add(key)
+            task = asyncio.create_task(self._send(key, text, final))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, key: tuple[int, int], text: str, final: bool):
+        try:
+            await uploader.edit_message(key[0], key[1], text)
+            self.sent += 1
+            if final:
+                self._last_sent.pop(key, None)
+            else:
+                self._last_sent[key] = text
+        except FloodWaitError as e:
+            self.flood_waits += 1
+            FLOOD_WAITS.labels('status').inc()
+            FLOOD_WAIT_SECONDS.labels('status').inc(e.seconds)
+            self._flood_until = max(self._flood_until, time.monotonic() + e.seconds)
+            logger.warning(f"FloodWait on status edit: {e.seconds}s")
+            # Retry later unless a newer text arrived meanwhile
+            if key not in self._pending:
+                self._pending[key] = (text, final)
+        finally:
+            self._sending.discard(key)
+            self._wakeup.set()
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for chat_id in [c for c, bucket in self._chats.items() if bucket.full(now)]:
+            del self._chats[chat_id]
+
+# Global instance
+status_updates = StatusScheduler()
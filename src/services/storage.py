@@ -0,0 +1,251 @@
+import os
+import time
+import shutil
+import asyncio
+from collections import deque
+from src.config import config
+from src.services.journal import job_journal
+from src.utils.logger import logger
+from src.utils.helpers import format_bytes
+
+
+class StorageFullError(Exception):
+    """Raised when a file can never fit in temp storage"""
+
+
+class Reservation:
+    """Disk space held by one job until its files are deleted"""
+
+    def __init__(self, manager: 'StorageManager'):
+        self.manager = manager
+        self.size = 0
+        self.paths: set[str] = set()  # Files of the job, never swept
+
+    async def reserve(self, size: int | None):
+        """
+        Make sure `size` bytes are held, waiting for space if needed
+
+        Unknown sizes reserve STORAGE_DEFAULT_RESERVE. Reserving less than
+        is already held is a no-op, so retries can call it again.
+        """
+        size = size or config.STORAGE_DEFAULT_RESERVE
+        if size > self.size:
+            await self.manager._acquire(self, size - self.size)
+
+    def protect(self, path: str):
+        """Keep the sweeper away from `path` until the reservation is released"""
+        self.paths.add(path)
+
+    def release(self):
+        self.manager._release(self)
+
+
+class StorageManager:
+    """
+    Admission control and cleanup for DOWNLOAD_DIR
+
+    Jobs reserve the expected size of their files before writing them and
+    wait in FIFO order while the reservations would exceed the capacity:
+    STORAGE_QUOTA if set, otherwise whatever the disk can take while
+    keeping STORAGE_MIN_FREE free. Files left behind by crashed jobs are
+    swept on startup and every STORAGE_SWEEP_INTERVAL, except those of
+    live reservations or of unfinished jobs in the job journal.
+
+    Disk usage of the download dir is walked in the executor every
+    STORAGE_USAGE_INTERVAL, so admission never walks it on the loop.
+    """
+
+    def __init__(self):
+        self._reservations: set[Reservation] = set()
+        self._active: set[Reservation] = set()  # Not released yet, granted or not
+        self._reserved = 0
+        self._used = 0
+        self._files = 0
+        self._waiters: deque[tuple[Reservation, int, asyncio.Future]] = deque()
+        self._sweeper: asyncio.Task | None = None
+        self._usage_task: asyncio.Task | None = None
+
+        self.waited = 0
+        self.swept_files = 0
+        self.swept_bytes = 0
+
+    async def start(self):
+        await self.sweep()
+        if not self._sweeper:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+            self._usage_task = asyncio.create_task(self._usage_loop())
+        logger.info(f"Storage manager started (capacity {format_bytes(self.capacity())})")
+
+    async def stop(self):
+        tasks = [task for task in (self._sweeper, self._usage_task) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._sweeper = None
+        self._usage_task = None
+
+    def reservation(self) -> Reservation:
+        reservation = Reservation(self)
+        self._active.add(reservation)
+        return reservation
+
+    def capacity(self) -> int:
+        """Bytes the download dir may hold in total"""
+        if config.STORAGE_QUOTA:
+            # Worker processes on the host split the quota
+            return config.STORAGE_QUOTA // max(config.WORKERS, 1)
+        disk = shutil.disk_usage(config.DOWNLOAD_DIR)
+        return max(disk.free + self._used - config.STORAGE_MIN_FREE, 0)
+
+    def stats(self) -> dict:
+        disk = shutil.disk_usage(config.DOWNLOAD_DIR)
+        return {
+            "capacity": self.capacity(),
+            "quota": config.STORAGE_QUOTA or None,
+            "reserved": self._reserved,
+            "used": self._used,
+            "files": self._files,
+            "diskFree": disk.free,
+            "reservations": len(self._reservations),
+            "waiting": len(self._waiters),
+            "waited": self.waited,
+            "sweptFiles": self.swept_files,
+            "sweptBytes": self.swept_bytes
+        }
+
+    async def sweep(self):
+        """Delete files nobody has touched for longer than the orphan age"""
+        protected = {path for reservation in self._active for path in reservation.paths}
+        protected |= job_journal.filepaths()
+
+        files, size = await asyncio.get_running_loop().run_in_executor(None, self._sweep, protected)
+        if files:
+            self.swept_files += files
+            self.swept_bytes += size
+            logger.info(f"Swept {files} orphan files ({format_bytes(size)})")
+        await self.refresh_usage()
+
+    async def refresh_usage(self):
+        self._used, self._files = await asyncio.get_running_loop().run_in_executor(None, self._disk_usage)
+
+    async def _acquire(self, reservation: Reservation, size: int):
+        capacity = self.capacity()
+        if reservation.size + size > capacity:
+            raise StorageFullError(
+                f"File needs {format_bytes(reservation.size + size)}, "
+                f"temp storage holds {format_bytes(capacity)}"
+            )
+
+        if not self._waiters and self._reserved + size <= capacity:
+            self._grant(reservation, size)
+            return
+
+        self.waited += 1
+        logger.info(f"Waiting for {format_bytes(size)} of temp storage ({len(self._waiters)} ahead)")
+        future = asyncio.get_running_loop().create_future()
+        entry = (reservation, size, future)
+        self._waiters.append(entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled, hand it back
+                self._reserved -= size
+                reservation.size -= size
+            else:
+                self._waiters.remove(entry)
+            self._wake()
+            raise
+
+    def _grant(self, reservation: Reservation, size: int):
+        reservation.size += size
+        self._reserved += size
+        self._reservations.add(reservation)
+
+    def _release(self, reservation: Reservation):
+        self._active.discard(reservation)
+        reservation.paths.clear()
+        if reservation in self._reservations:
+            self._reservations.discard(reservation)
+            self._reserved -= reservation.size
+            reservation.size = 0
+            self._wake()
+
+    def _wake(self):
+        """Grant waiting reservations in order while they fit"""
+        capacity = self.capacity()
+        while self._waiters:
+            reservation, size, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            # The oldest waiter always gets in once nothing else is held
+            if self._reserved + size > capacity and self._reserved:
+                break
+            self._waiters.popleft()
+            self._grant(reservation, size)
+            future.set_result(None)
+
+    def _disk_usage(self) -> tuple[int, int]:
+        """(bytes, files) currently in the download dir"""
+        total = files = 0
+        for root, _, names in os.walk(config.DOWNLOAD_DIR):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                    files += 1
+                except OSError:
+                    pass
+        return total, files
+
+    def _sweep(self, protected: set[str]) -> tuple[int, int]:
+        now = time.time()
+        files = size = 0
+
+        for root, _, names in os.walk(config.DOWNLOAD_DIR, topdown=False):
+            removed = False
+            for name in names:
+                path = os.path.join(root, name)
+                if path in protected:
+                    continue
+                # Resumable downloads keep their partial file and state longer
+                resumable = name.endswith(('.part', '.part.json', '.part.lock'))
+                max_age = config.STORAGE_PARTIAL_AGE if resumable else config.STORAGE_ORPHAN_AGE
+                try:
+                    stat = os.stat(path)
+                    if now - stat.st_mtime > max_age:
+                        os.remove(path)
+                        removed = True
+                        files += 1
+                        size += stat.st_size
+                except OSError:
+                    pass
+
+            # Per-job directories, once empty (rmdir fails otherwise)
+            if root != config.DOWNLOAD_DIR:
+                try:
+                    if removed or now - os.stat(root).st_mtime > config.STORAGE_ORPHAN_AGE:
+                        os.rmdir(root)
+                except OSError:
+                    pass
+
+        return files, size
+
+    async def _usage_loop(self):
+        while True:
+            await asyncio.sleep(config.STORAGE_USAGE_INTERVAL)
+            try:
+                await self.refresh_usage()
+            except Exception as e:
+                logger.error(f"Storage usage refresh failed: {e}")
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(config.STORAGE_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {e}")
+
+# Global instance
+storage_manager = StorageManager()
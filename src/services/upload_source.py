@@ -0,0 +1,101 @@
+import asyncio
+import mmap
+import os
+from typing import AsyncIterator
+
+
+class FileSource:
+    """
+    Upload parts read straight from a file with pread
+
+    Each part is read into its own bytes object, the one copy Telethon
+    needs anyway (its requests only take bytes), instead of going
+    through a re-splitting buffer. Reads run in the default executor
+    with the GIL released and one part ahead of the consumer.
+    """
+
+    def __init__(self, path: str, part_size: int):
+        self.path = path
+        self.part_size = part_size
+
+    async def parts(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        fd = os.open(self.path, os.O_RDONLY)
+        pending = None
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+            offset = 0
+            pending = loop.run_in_executor(None, os.pread, fd, self.part_size, offset)
+            while True:
+                # Shielded: a cancel mustn't mark the read done while the thread still runs
+                part = await asyncio.shield(pending)
+                pending = None
+                if not part:
+                    break
+                offset += len(part)
+                pending = loop.run_in_executor(None, os.pread, fd, self.part_size, offset)
+                yield part
+        finally:
+            if pending:
+                # The executor may still be reading, don't close under it
+                await asyncio.gather(pending, return_exceptions=True)
+            os.close(fd)
+
+
+class MmapFileSource:
+    """
+    Upload parts sliced from a read-only memory map
+
+    Slicing copies each part exactly once too, but the copy holds the
+    GIL and page faults stall the event loop, so FileSource is what the
+    uploader uses; this one is kept for benchmarks/upload_parts.py.
+    """
+
+    def __init__(self, path: str, part_size: int):
+        self.path = path
+        self.part_size = part_size
+
+    async def parts(self) -> AsyncIterator[bytes]:
+        with open(self.path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                for offset in range(0, len(mm), self.part_size):
+                    yield mm[offset:offset + self.part_size]
+                    await asyncio.sleep(0)
+
+
+async def split_parts(chunks: AsyncIterator[bytes], part_size: int) -> AsyncIterator[bytes]:
+    """
+    Cut a stream of chunks into parts of `part_size` (the last may be shorter)
+
+    Chunks are held as memoryviews and joined once per part, so each
+    byte is copied a single time; a chunk that already is exactly one
+    part is passed through as is.
+    """
+    pending: list[memoryview] = []
+    pending_size = 0
+
+    def join() -> bytes:
+        if len(pending) == 1 and isinstance(pending[0].obj, bytes) and len(pending[0]) == len(pending[0].obj):
+            return pending[0].obj
+        return b''.join(pending)
+
+    async for chunk in chunks:
+        view = memoryview(chunk)
+        while view:
+            take = min(part_size - pending_size, len(view))
+            pending.append(view[:take])
+            pending_size += take
+            view = view[take:]
+            if pending_size == part_size:
+                yield join()
+                pending.clear()
+                pending_size = 0
+
+    if pending:
+        yield join()
@@ -1,34 +1,190 @@
 import os
+import asyncio
+import fcntl
+import hashlib
+import inspect
+import random
+import time
+from typing import AsyncIterator
 from telethon import TelegramClient
-from telethon.tl.types import DocumentAttributeFilename
+from telethon.errors import FloodWaitError
+from telethon.tl.custom import InputSizedFile
+from telethon.tl.functions.upload import SaveBigFilePartRequest, SaveFilePartRequest
+from telethon.tl.types import DocumentAttributeFilename, InputDocument, InputFileBig
+from src.services.fast_upload import ParallelUploader
+from src.services.upload_source import FileSource, split_parts
 from src.config import config
 from src.utils.logger import logger
 from src.utils.helpers import format_bytes
 
+class BotClient:
+    """One bot account: its Telethon client, upload load and health"""
+    
+    # Session slots per host, one per worker process
+    MAX_SESSIONS = 64
+    
+    # Consecutive failed uploads before the bot is rested
+    MAX_FAILURES = 3
+    
+    def __init__(self, name: str, token: str):
+        self.name = name
+        self.token = token
+        # Created on start, so only processes that serve jobs claim a session
+        self.client: TelegramClient | None = None
+        self.username = None
+        self.started = False
+        self._session_lock = None
+        
+        self.active = 0
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.upload_seconds = 0.0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.flood_waits = 0
+        self.blocked_until = 0.0
+        self.last_error = None
+    
+    def _claim_session(self) -> str:
+        """
+        Lock a session file no other process on this host is using
+        
+        Telethon's sqlite session can't be shared between processes, so
+        each uvicorn worker takes the first free slot: `name`, `name_1`,
+        ... The lock is held until the process exits and is released by
+        the OS even if it crashes.
+        """
+        for slot in range(self.MAX_SESSIONS):
+            session = self.name if slot == 0 else f"{self.name}_{slot}"
+            path = os.path.join(config.SESSION_DIR, session)
+            lock = open(f"{path}.lock", 'w')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                continue
+            self._session_lock = lock
+            return path
+        raise Exception(f"All {self.MAX_SESSIONS} Telethon sessions are in use")
+    
+    async def start(self):
+        if self.started:
+            return
+        if self.client is None:
+            session = self._claim_session()
+            logger.info(f"Telethon session: {session}")
+            self.client = TelegramClient(
+                session=session,
+                api_id=config.TELEGRAM_API_ID,
+                api_hash=config.TELEGRAM_API_HASH
+            )
+        await self.client.start(bot_token=self.token)
+        self.started = True
+        me = await self.client.get_me()
+        self.username = me.username
+        logger.info(f"Telethon started as @{me.username}")
+    
+    async def stop(self):
+        if self.started:
+            await self.client.disconnect()
+            self.started = False
+    
+    @property
+    def available(self) -> bool:
+        """Started and not in FloodWait or resting after failures"""
+        return self.started and time.monotonic() >= self.blocked_until
+    
+    def throughput(self) -> float:
+        """Average upload speed in bytes per second"""
+        return self.uploaded_bytes / self.upload_seconds if self.upload_seconds else 0.0
+    
+    def flood_wait(self, seconds: int):
+        self.flood_waits += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        logger.warning(f"Bot @{self.username} in FloodWait for {seconds}s")
+    
+    def record_upload(self, size: int, seconds: float):
+        self.uploads += 1
+        self.uploaded_bytes += size
+        self.upload_seconds += seconds
+        self.consecutive_failures = 0
+    
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+        if self.consecutive_failures >= self.MAX_FAILURES:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + config.BOT_FAILURE_COOLDOWN)
+            logger.warning(f"Bot @{self.username} failed {self.consecutive_failures} uploads in a row, resting it")
+    
+    def stats(self) -> dict:
+        return {
+            "username": self.username,
+            "started": self.started,
+            "available": self.available,
+            "active": self.active,
+            "uploads": self.uploads,
+            "uploadedBytes": self.uploaded_bytes,
+            "throughput": int(self.throughput()),
+            "failures": self.failures,
+            "floodWaits": self.flood_waits,
+            "blockedFor": max(int(self.blocked_until - time.monotonic()), 0),
+            "lastError": self.last_error
+        }
+
+
 class UploaderService:
+    """
+    Telegram client pool
+    
+    The primary bot (BOT_TOKEN) handles everything users see: status
+    messages and delivering documents. Uploads to the backup channel are
+    spread over the primary and the BOT_TOKENS bots, so a FloodWait on
+    one account doesn't stall every upload. All bots must be admins of
+    BACKUP_CHANNEL_ID.
+    """
+    
+    # Telegram's maximum upload part size
+    PART_SIZE = 512 * 1024
+    
     def __init__(self):
-        self.client = TelegramClient(
-            session=os.path.join(config.SESSION_DIR, 'bot_session'),
-            api_id=config.TELEGRAM_API_ID,
-            api_hash=config.TELEGRAM_API_HASH
-        )
+        self.primary = BotClient('bot_session', config.BOT_TOKEN)
+        self.bots = [self.primary] + [
+            BotClient(f"upload_session_{token.split(':')[0]}", token)
+            for token in dict.fromkeys(config.BOT_TOKENS)
+            if token != config.BOT_TOKEN
+        ]
         self._started = False
     
+    @property
+    def client(self) -> TelegramClient | None:
+        """The primary bot's client"""
+        return self.primary.client
+    
     async def start(self):
-        """Start Telethon client"""
+        """Start Telethon clients"""
         if not self._started:
-            await self.client.start(bot_token=config.BOT_TOKEN)
+            await self.primary.start()
+            for bot in self.bots[1:]:
+                try:
+                    await bot.start()
+                except Exception as e:
+                    # Uploads go to the bots that did start
+                    bot.last_error = str(e)
+                    logger.error(f"Upload bot {bot.name} failed to start: {e}")
             self._started = True
-            me = await self.client.get_me()
-            logger.info(f"Telethon started as @{me.username}")
     
     async def stop(self):
-        """Stop Telethon client"""
+        """Stop Telethon clients"""
         if self._started:
-            await self.client.disconnect()
+            for bot in self.bots:
+                await bot.stop()
             self._started = False
             logger.info("Telethon stopped")
     
+    def stats(self) -> dict:
+        return {"bots": [bot.stats() for bot in self.bots]}
+    
     async def send_message(
         self, 
         chat_id: int, 
@@ -57,6 +213,8 @@ class UploaderService:
                 message=message_id,
                 text=text
             )
+        except FloodWaitError:
+            raise
         except Exception as e:
             logger.warning(f"Failed to edit message: {e}")
             return None
@@ -85,20 +243,176 @@ class UploaderService:
         if not filename:
             filename = os.path.basename(filepath)
         
-        # Create document attributes
-        attributes = [DocumentAttributeFilename(file_name=filename)]
+        parts = FileSource(filepath, self.PART_SIZE).parts()
+        return await self._upload(chat_id, parts, file_size, filename, caption, reply_to, progress_callback)
+    
+    async def upload_stream(
+        self,
+        chat_id: int,
+        chunks: AsyncIterator[bytes],
+        file_size: int,
+        filename: str,
+        caption: str | None = None,
+        reply_to: int | None = None,
+        progress_callback=None
+    ):
+        """Upload document while it's still being downloaded"""
+        await self.start()
+        
+        logger.info(f"Streaming upload: {filename}")
+        logger.info(f"Size: {format_bytes(file_size)}")
         
-        # Upload with progress
-        message = await self.client.send_file(
-            entity=chat_id,
-            file=filepath,
-            caption=caption,
-            reply_to=reply_to,
-            attributes=attributes,
-            force_document=True,
-            progress_callback=progress_callback,
-            silent=file_size > 50 * 1024 * 1024  # Silent for files > 50MB
-        )
+        if file_size > config.MAX_FILE_SIZE:
+            raise Exception(f"File too large: {format_bytes(file_size)}")
+        
+        parts = split_parts(chunks, self.PART_SIZE)
+        return await self._upload(chat_id, parts, file_size, filename, caption, reply_to, progress_callback)
+    
+    async def _pick_bot(self) -> BotClient:
+        """Least loaded bot that isn't in FloodWait, waits if all are"""
+        while True:
+            bots = [bot for bot in self.bots if bot.available]
+            if bots:
+                return min(bots, key=lambda bot: (bot.active, -bot.throughput()))
+            
+            wait = min(bot.blocked_until for bot in self.bots if bot.started) - time.monotonic()
+            logger.warning(f"All upload bots are blocked, waiting {wait:.0f}s")
+            await asyncio.sleep(max(wait, 0.1))
+    
+    async def _upload(
+        self,
+        chat_id: int,
+        parts: AsyncIterator[bytes],
+        file_size: int,
+        filename: str,
+        caption: str | None = None,
+        reply_to: int | None = None,
+        progress_callback=None
+    ):
+        """Upload and send with a pool bot, returns the message as the primary bot sees it"""
+        bot = await self._pick_bot()
+        bot.active += 1
+        started = time.monotonic()
+        try:
+            input_file = await self._upload_file(bot, parts, file_size, filename, progress_callback)
+            message = await self._send_uploaded(bot, chat_id, input_file, file_size, filename, caption, reply_to)
+        except Exception as e:
+            bot.record_failure(e)
+            raise
+        finally:
+            bot.active -= 1
+        bot.record_upload(file_size, time.monotonic() - started)
+        
+        if bot is self.primary:
+            return message
+        
+        # Access hashes and file references are per account, so the
+        # primary reads the message back to get ones it can send with
+        logger.info(f"Uploaded by @{bot.username}, fetching message {message.id} as primary")
+        own = await self.primary.client.get_messages(chat_id, ids=message.id)
+        if not own or not own.document:
+            raise Exception(f"Uploaded message {message.id} not visible to the primary bot")
+        return own
+    
+    async def _upload_file(
+        self,
+        bot: BotClient,
+        parts: AsyncIterator[bytes],
+        file_size: int,
+        filename: str,
+        progress_callback=None
+    ):
+        """
+        Upload file parts, returns InputFile for sending
+
+        `parts` must be PART_SIZE each (the last may be shorter), see
+        upload_source. They're fed through a bounded buffer to
+        UPLOAD_CONNECTIONS parallel senders, so a slow upload holds back
+        the producer instead of piling up parts in memory.
+        """
+        part_size = self.PART_SIZE
+        part_count = (file_size + part_size - 1) // part_size
+        is_big = file_size > 10 * 1024 * 1024
+        file_id = random.randrange(-2 ** 63, 2 ** 63)
+        hash_md5 = hashlib.md5()
+        
+        requests: asyncio.Queue = asyncio.Queue(maxsize=config.STREAM_BUFFER_PARTS)
+        
+        def make_request(index: int, part: bytes):
+            if is_big:
+                return SaveBigFilePartRequest(file_id, index, part_count, part)
+            # Small files need MD5 of all parts, in order
+            hash_md5.update(part)
+            return SaveFilePartRequest(file_id, index, part)
+        
+        async def produce():
+            index = 0
+            async for part in parts:
+                if index >= part_count:
+                    raise Exception(f"File size mismatch: more than {part_count} parts")
+                await requests.put((len(part), make_request(index, part)))
+                index += 1
+            
+            if index != part_count:
+                raise Exception(f"File size mismatch: got {index} of {part_count} parts")
+            await requests.put(None)
+        
+        uploaded = 0
+        
+        async def on_part(size: int):
+            nonlocal uploaded
+            uploaded += size
+            if progress_callback:
+                result = progress_callback(uploaded, file_size)
+                if inspect.isawaitable(result):
+                    await result
+        
+        # Extra connections only pay off for big files
+        connections = config.UPLOAD_CONNECTIONS if is_big else 1
+        parallel = ParallelUploader(bot.client, min(connections, part_count), on_flood_wait=bot.flood_wait)
+        
+        tasks = [asyncio.create_task(produce()), asyncio.create_task(parallel.run(requests, on_part))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        if is_big:
+            return InputFileBig(file_id, part_count, filename)
+        return InputSizedFile(file_id, part_count, filename, md5=hash_md5, size=file_size)
+    
+    async def _send_uploaded(
+        self,
+        bot: BotClient,
+        chat_id: int,
+        input_file,
+        file_size: int,
+        filename: str,
+        caption: str | None = None,
+        reply_to: int | None = None
+    ):
+        """Send uploaded file as document"""
+        # Uploaded parts belong to this bot, so it has to be the one sending
+        for attempt in range(2):
+            try:
+                message = await bot.client.send_file(
+                    entity=chat_id,
+                    file=input_file,
+                    caption=caption,
+                    reply_to=reply_to,
+                    attributes=[DocumentAttributeFilename(file_name=filename)],
+                    force_document=True,
+                    silent=file_size > 50 * 1024 * 1024  # Silent for files > 50MB
+                )
+                break
+            except FloodWaitError as e:
+                bot.flood_wait(e.seconds)
+                if attempt:
+                    raise
+                await asyncio.sleep(e.seconds)
         
         logger.info(f"Upload completed: file_id={message.document.id}")
         return message
@@ -115,6 +429,8 @@ class UploaderService:
         
         # Get the message first
         message = await self.client.get_messages(from_chat, ids=message_id)
+        if not message:
+            raise Exception(f"Message {message_id} not found in {from_chat}")
         
         # Send as copy (forward without quote)
         return await self.client.send_message(
@@ -124,5 +440,38 @@ class UploaderService:
             reply_to=reply_to
         )
 
+    async def send_document(
+        self,
+        to_chat: int,
+        document_id: int,
+        access_hash: int,
+        file_reference: bytes,
+        caption: str | None = None,
+        reply_to: int | None = None
+    ):
+        """
+        Send an already uploaded document by reference
+
+        One SendMedia call, no fetch of the original message. Raises
+        FileReferenceExpiredError when the reference needs a refresh.
+        """
+        await self.start()
+        
+        return await self.client.send_file(
+            entity=to_chat,
+            file=InputDocument(id=document_id, access_hash=access_hash, file_reference=file_reference),
+            caption=caption or '',
+            reply_to=reply_to
+        )
+    
+    async def get_document(self, chat_id: int, message_id: int):
+        """Fetch message and return its document (fresh file reference)"""
+        await self.start()
+        
+        message = await self.client.get_messages(chat_id, ids=message_id)
+        if not message or not message.document:
+            raise Exception(f"Document message {message_id} not found in {chat_id}")
+        return message.document
+
 # Global instance
 uploader = UploaderService()
\ No newline at end of file
@@ -1,9 +1,18 @@
 import os
-import asyncio
+import json
+import shutil
+import hashlib
+import time
 from typing import Optional
-from yt_dlp import YoutubeDL
+from src.services.ytdlp_pool import ytdlp_pool
+from src.services.info_cache import info_cache
+from src.services.postprocess import postprocess_policy
+from src.services.proxy_pool import proxy_pool
+from src.services.host_limiter import host_limiter
+from src.services.storage import Reservation
 from src.utils.logger import logger
-from src.utils.helpers import get_temp_filepath, get_random_user_agent, get_random_proxy, sanitize_filename
+from src.utils.url_router import url_router
+from src.utils.helpers import get_temp_filepath, get_random_user_agent, sanitize_filename, normalize_url
 from src.config import config
 
 class YtDlpService:
@@ -12,6 +21,7 @@ class YtDlpService:
         'youtube': {
             'format': 'bestvideo[ext=mp4][height<=1080]+bestaudio[ext=m4a]/best[ext=mp4]/best',
             'merge_output_format': 'mp4',
+            'concurrent_fragment_downloads': 8,
         },
         'spotify': {
             'format': 'bestaudio/best',
@@ -30,43 +40,36 @@ class YtDlpService:
             'extract_audio': True,
             'audio_format': 'mp3',
             'audio_quality': '320K',
+            # Small HLS segments, latency bound
+            'concurrent_fragment_downloads': 8,
         },
         'pornhub': {
             'format': 'best[height<=1080]',
             'age_limit': 18,
+            'concurrent_fragment_downloads': 8,
         },
         'xvideos': {
             'format': 'best',
             'age_limit': 18,
+            'concurrent_fragment_downloads': 8,
         },
         'xnxx': {
             'format': 'best',
             'age_limit': 18,
+            'concurrent_fragment_downloads': 8,
         }
     }
     
-    def _detect_platform(self, url: str) -> Optional[str]:
-        """Detect platform from URL"""
-        url_lower = url.lower()
-        
-        if 'youtube.com' in url_lower or 'youtu.be' in url_lower:
-            return 'youtube'
-        elif 'spotify.com' in url_lower:
-            return 'spotify'
-        elif 'deezer.com' in url_lower:
-            return 'deezer'
-        elif 'soundcloud.com' in url_lower:
-            return 'soundcloud'
-        elif 'pornhub.com' in url_lower:
-            return 'pornhub'
-        elif 'xvideos.com' in url_lower:
-            return 'xvideos'
-        elif 'xnxx.com' in url_lower:
-            return 'xnxx'
-        
-        return None
+    # How long extracted info stays usable (signed media URLs expire)
+    INFO_TTLS = {
+        'youtube': 3 * 3600,  # googlevideo URLs expire after ~6 hours
+        'soundcloud': 600,
+        'pornhub': 1800,
+        'xvideos': 1800,
+        'xnxx': 1800,
+    }
     
-    def _get_ydl_opts(self, platform: Optional[str], output_path: str) -> dict:
+    def _get_ydl_opts(self, platform: Optional[str], output_path: str, url: str) -> dict:
         """Build yt-dlp options"""
         
         # Base options
@@ -79,15 +82,33 @@ class YtDlpService:
             'retries': 5,
             'fragment_retries': 5,
             'socket_timeout': 30,
+            # Fetch HLS/DASH fragments in parallel instead of one round trip at a time
+            'concurrent_fragment_downloads': config.YTDLP_FRAGMENT_CONCURRENCY,
+            'buffersize': config.YTDLP_BUFFER_SIZE,
+            # Ranged requests dodge per-connection throttling on long DASH streams
+            'http_chunk_size': config.YTDLP_HTTP_CHUNK_SIZE,
         }
         
+        # Optional external downloader (aria2c splits files over several connections)
+        external = config.YTDLP_EXTERNAL_DOWNLOADER
+        if external:
+            if shutil.which(external):
+                connections = str(config.YTDLP_EXTERNAL_CONNECTIONS)
+                opts['external_downloader'] = {'default': external}
+                if external == 'aria2c':
+                    opts['external_downloader_args'] = {
+                        'aria2c': ['-x', connections, '-s', connections, '-k', '1M', '--summary-interval=1']
+                    }
+            else:
+                logger.warning(f"External downloader not found: {external}")
+        
         # Add cookies if available
         if os.path.exists(config.COOKIE_FILE):
             opts['cookiefile'] = config.COOKIE_FILE
             logger.info(f"Using cookies from: {config.COOKIE_FILE}")
         
-        # Add proxy if available
-        proxy = get_random_proxy()
+        # Best healthy proxy for the target domain
+        proxy = proxy_pool.choose(url)
         if proxy:
             opts['proxy'] = proxy
             logger.info(f"Using proxy: {proxy}")
@@ -114,10 +135,99 @@ class YtDlpService:
         
         return opts
     
-    async def download(self, url: str, custom_filename: Optional[str] = None) -> str:
-        """Download media using yt-dlp"""
+    def _info_key(self, url: str, platform: Optional[str]) -> str:
+        """Cache key: normalized URL plus the platform config it was extracted with"""
+        platform_config = json.dumps(self.PLATFORM_CONFIGS.get(platform), sort_keys=True)
+        config_hash = hashlib.sha1(platform_config.encode()).hexdigest()[:12]
+        return f"{normalize_url(url)}|{platform or ''}|{config_hash}"
+    
+    async def _extract(self, url: str, platform: Optional[str], ydl_opts: dict) -> tuple[dict, bool]:
+        """
+        Cached or freshly extracted info entry
+        
+        Returns ({'info': ..., 'proxy': ...}, cached). The proxy is kept
+        because signed media URLs may be bound to the IP that extracted them.
+        """
+        key = self._info_key(url, platform)
+        entry = info_cache.get(key)
+        if entry and proxy_pool.usable(entry['proxy'], url):
+            logger.info(f"yt-dlp info from cache: {key}")
+            return entry, True
         
-        platform = self._detect_platform(url)
+        proxy = ydl_opts.get('proxy')
+        try:
+            async with host_limiter.slot(url):
+                started = time.monotonic()
+                info = await ytdlp_pool.extract_info(url, ydl_opts)
+        except Exception as e:
+            host_limiter.throttle_error(url, e)
+            proxy_pool.record_error(proxy, url, e)
+            raise
+        proxy_pool.record_success(proxy, url, latency=time.monotonic() - started)
+        entry = {'info': info, 'proxy': proxy}
+        info_cache.put(key, entry, self.INFO_TTLS.get(platform, config.INFO_CACHE_TTL))
+        return entry, False
+    
+    @staticmethod
+    def _estimate_size(info: dict) -> Optional[int]:
+        """Disk space a download needs, None if yt-dlp doesn't know"""
+        formats = info.get('requested_formats') or [info]
+        sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+        if not all(sizes):
+            return None
+        # Merging keeps the parts on disk next to the merged output
+        return sum(sizes) * (2 if len(formats) > 1 else 1)
+    
+    async def _download_entry(self, url: str, ydl_opts: dict, entry: dict, progress_callback=None) -> str:
+        """Download through the proxy the info was extracted with, scoring it"""
+        proxy = entry['proxy']
+        try:
+            async with host_limiter.slot(url):
+                started = time.monotonic()
+                filepath = await ytdlp_pool.download(
+                    url,
+                    postprocess_policy.apply({**ydl_opts, 'proxy': proxy}, entry['info']),
+                    info=entry['info'],
+                    on_progress=progress_callback
+                )
+        except Exception as e:
+            host_limiter.throttle_error(url, e)
+            proxy_pool.record_error(proxy, url, e)
+            raise
+        proxy_pool.record_success(proxy, url, size=os.path.getsize(filepath), seconds=time.monotonic() - started)
+        return filepath
+    
+    def cached_info(self, url: str) -> Optional[dict]:
+        """Info dict from the extraction cache only, None if it's not there"""
+        platform = url_router.route(url).platform
+        entry = info_cache.get(self._info_key(url, platform))
+        if entry and proxy_pool.usable(entry['proxy'], url):
+            return entry['info']
+        return None
+    
+    async def get_info(self, url: str) -> tuple[dict, bool]:
+        """Extract media info without downloading, returns (info, cached)"""
+        platform = url_router.route(url).platform
+        ydl_opts = self._get_ydl_opts(platform, get_temp_filepath(f"ytdlp_{platform or 'unknown'}"), url)
+        
+        entry, cached = await self._extract(url, platform, ydl_opts)
+        return entry['info'], cached
+    
+    async def download(
+        self,
+        url: str,
+        custom_filename: Optional[str] = None,
+        progress_callback=None,
+        reservation: Optional[Reservation] = None
+    ) -> str:
+        """
+        Download media using yt-dlp
+        
+        Runs in a worker process; `progress_callback` gets yt-dlp progress dicts.
+        `reservation` is grown to the expected file size before downloading.
+        """
+        
+        platform = url_router.route(url).platform
         output_path = get_temp_filepath(f"ytdlp_{platform or 'unknown'}")
         
         logger.info(f"yt-dlp download started")
@@ -125,32 +235,24 @@ class YtDlpService:
         logger.info(f"Platform: {platform or 'unknown'}")
         logger.info(f"Output: {output_path}")
         
-        ydl_opts = self._get_ydl_opts(platform, output_path)
-        
-        # Run in executor to avoid blocking
-        loop = asyncio.get_event_loop()
-        
-        def _download():
-            with YoutubeDL(ydl_opts) as ydl:
-                try:
-                    # Extract info and download
-                    info = ydl.extract_info(url, download=True)
-                    
-                    # Get the actual filename
-                    filename = ydl.prepare_filename(info)
-                    
-                    # Check if file exists
-                    if not os.path.exists(filename):
-                        raise FileNotFoundError(f"Downloaded file not found: {filename}")
-                    
-                    return filename
-                    
-                except Exception as e:
-                    logger.error(f"yt-dlp error: {e}")
-                    raise
+        ydl_opts = self._get_ydl_opts(platform, output_path, url)
         
         try:
-            filepath = await loop.run_in_executor(None, _download)
+            entry, cached = await self._extract(url, platform, ydl_opts)
+            if reservation:
+                await reservation.reserve(self._estimate_size(entry['info']))
+            
+            try:
+                filepath = await self._download_entry(url, ydl_opts, entry, progress_callback)
+            except Exception as e:
+                if not cached:
+                    raise
+                
+                # Media URLs in the cached info may have expired early
+                logger.warning(f"Download from cached info failed, extracting again: {e}")
+                info_cache.invalidate(self._info_key(url, platform))
+                entry, _ = await self._extract(url, platform, ydl_opts)
+                filepath = await self._download_entry(url, ydl_opts, entry, progress_callback)
             
             file_size = os.path.getsize(filepath)
             logger.info(f"yt-dlp success: {filepath} ({file_size} bytes)")
@@ -159,4 +261,4 @@ class YtDlpService:
             
         except Exception as e:
             logger.error(f"yt-dlp failed: {e}", exc_info=True)
-            raise Exception(f"Failed to download from {platform or 'platform'}: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to download from {platform or 'platform'}: {str(e)}")
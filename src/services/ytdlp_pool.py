@@ -0,0 +1,309 @@
+import os
+import time
+import threading
+import asyncio
+import multiprocessing
+from src.config import config
+from src.utils.logger import logger
+
+
+# Seconds between progress messages sent back by a worker
+PROGRESS_INTERVAL = 0.5
+
+
+def _worker_main(conn):
+    """
+    Entry point of a yt-dlp worker process
+
+    Reads (op, url, opts, info) requests from `conn` until None, and
+    answers each with any number of ('progress', dict) messages followed
+    by a single ('done', result) or ('error', message).
+
+    'info' extracts without downloading and returns the sanitized info
+    dict. 'download' returns the file path; when `info` is given it's
+    processed directly instead of running the extractor again.
+
+    Before running an ffmpeg postprocessor the worker sends ('ffmpeg',
+    True) and waits for the parent to grant a slot, then releases it with
+    ('ffmpeg', False), so ffmpeg runs are limited across all workers.
+    """
+    from yt_dlp import YoutubeDL
+    from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+
+    # Progress hooks also run on yt-dlp's fragment threads
+    # (concurrent_fragment_downloads), and interleaved sends corrupt the pipe
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    class LimitedYoutubeDL(YoutubeDL):
+        def run_pp(self, pp, infodict):
+            if not isinstance(pp, FFmpegPostProcessor):
+                return super().run_pp(pp, infodict)
+
+            send(('ffmpeg', True))
+            conn.recv()
+            try:
+                return super().run_pp(pp, infodict)
+            finally:
+                send(('ffmpeg', False))
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        op, url, opts, info = request
+        last_sent = 0.0
+
+        def progress_hook(d):
+            nonlocal last_sent
+            with send_lock:
+                now = time.monotonic()
+                if d['status'] == 'downloading' and now - last_sent < PROGRESS_INTERVAL:
+                    return
+                last_sent = now
+            send(('progress', {
+                'status': d['status'],
+                'downloaded_bytes': d.get('downloaded_bytes'),
+                'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+                'speed': d.get('speed'),
+                'eta': d.get('eta'),
+            }))
+
+        try:
+            with LimitedYoutubeDL({**opts, 'progress_hooks': [progress_hook]}) as ydl:
+                if op == 'info':
+                    info = ydl.extract_info(url, download=False)
+                    send(('done', ydl.sanitize_info(info)))
+                    continue
+
+                if info:
+                    info = ydl.process_ie_result(info, download=True)
+                else:
+                    info = ydl.extract_info(url, download=True)
+                filename = ydl.prepare_filename(info)
+
+            if not os.path.exists(filename):
+                raise FileNotFoundError(f"Downloaded file not found: {filename}")
+
+            send(('done', filename))
+        except Exception as e:
+            send(('error', str(e)))
+
+
+class _Worker:
+    """Parent side of one worker process"""
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        # Only the child keeps its end, so we see EOF when it dies
+        child_conn.close()
+        self.jobs = 0
+        self.ffmpeg_slot = False
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class YtDlpProcessPool:
+    """
+    Runs yt-dlp jobs in a bounded pool of worker processes
+
+    Extraction and format selection are CPU-heavy Python; in a thread they
+    hold the GIL and stall the event loop. Workers are reused between jobs
+    and killed (then replaced) when a job is cancelled or times out.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(size, 1)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle: list[_Worker] = []
+        self._busy: set[_Worker] = set()
+        self._slots: asyncio.Semaphore | None = None
+        self._ffmpeg_slots: asyncio.Semaphore | None = None
+        self._ffmpeg_active = 0
+
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.killed = 0
+
+    async def stop(self):
+        workers = self._idle + list(self._busy)
+        self._idle = []
+        self._busy = set()
+        for worker in workers:
+            await asyncio.get_running_loop().run_in_executor(None, worker.close)
+        if workers:
+            logger.info(f"yt-dlp workers stopped: {len(workers)}")
+
+    async def download(
+        self,
+        url: str,
+        opts: dict,
+        info: dict | None = None,
+        on_progress=None,
+        timeout: float | None = None
+    ) -> str:
+        """
+        Download `url` with yt-dlp `opts` in a worker, returns the file path
+
+        `info` is a previously extracted info dict to download from.
+        `on_progress` is called with a dict of yt-dlp progress fields.
+        """
+        return await self._submit(('download', url, opts, info), on_progress, timeout)
+
+    async def extract_info(self, url: str, opts: dict, timeout: float | None = None) -> dict:
+        """Extract info dict of `url` in a worker, without downloading"""
+        return await self._submit(('info', url, opts, None), None, timeout)
+
+    async def _submit(self, request: tuple, on_progress, timeout: float | None):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+            self._ffmpeg_slots = asyncio.Semaphore(config.FFMPEG_CONCURRENCY)
+
+        async with self._slots:
+            worker = await self._acquire()
+            try:
+                result = await asyncio.wait_for(
+                    self._communicate(worker, request, on_progress),
+                    timeout=timeout or config.YTDLP_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._discard(worker)
+                raise Exception(f"yt-dlp timed out after {timeout or config.YTDLP_TIMEOUT}s")
+            except BaseException:
+                # Cancelled or broken pipe: the worker may still be running the job
+                self._discard(worker)
+                raise
+
+            self._release(worker)
+
+        status, value = result
+        if status == 'error':
+            self.failed += 1
+            raise Exception(value)
+
+        self.completed += 1
+        return value
+
+    @property
+    def saturated(self) -> bool:
+        """Whether a new job would have to wait for a worker"""
+        return len(self._busy) >= self.size or (self._slots is not None and self._slots.locked())
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "busy": len(self._busy),
+            "ffmpegActive": self._ffmpeg_active,
+            "ffmpegLimit": config.FFMPEG_CONCURRENCY,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "killed": self.killed
+        }
+
+    async def _acquire(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.alive():
+                break
+            worker.kill()
+        else:
+            # Spawning imports yt-dlp in the child, keep it off the loop
+            worker = await asyncio.get_running_loop().run_in_executor(None, _Worker, self._ctx)
+        self._busy.add(worker)
+        return worker
+
+    def _release(self, worker: _Worker):
+        self._busy.discard(worker)
+        worker.jobs += 1
+        if worker.jobs >= config.YTDLP_WORKER_MAX_JOBS:
+            # Recycle long-lived workers, yt-dlp extractors keep module-level state
+            asyncio.get_running_loop().run_in_executor(None, worker.close)
+        else:
+            self._idle.append(worker)
+
+    def _discard(self, worker: _Worker):
+        self._busy.discard(worker)
+        self.killed += 1
+        worker.kill()
+        self._release_ffmpeg(worker)
+
+    async def _grant_ffmpeg(self, worker: _Worker):
+        await self._ffmpeg_slots.acquire()
+        worker.ffmpeg_slot = True
+        self._ffmpeg_active += 1
+        try:
+            worker.conn.send(True)
+        except OSError:
+            self._release_ffmpeg(worker)
+
+    def _release_ffmpeg(self, worker: _Worker):
+        if worker.ffmpeg_slot:
+            worker.ffmpeg_slot = False
+            self._ffmpeg_active -= 1
+            self._ffmpeg_slots.release()
+
+    async def _communicate(self, worker: _Worker, request, on_progress) -> tuple:
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        fd = worker.conn.fileno()
+        grant: asyncio.Task | None = None
+
+        def on_readable():
+            nonlocal grant
+            try:
+                while worker.conn.poll():
+                    kind, value = worker.conn.recv()
+                    if kind == 'progress':
+                        if on_progress:
+                            on_progress(value)
+                    elif kind == 'ffmpeg':
+                        if value:
+                            grant = asyncio.create_task(self._grant_ffmpeg(worker))
+                        else:
+                            self._release_ffmpeg(worker)
+                    elif not result.done():
+                        result.set_result((kind, value))
+            except (EOFError, OSError):
+                if not result.done():
+                    result.set_exception(Exception("yt-dlp worker exited unexpectedly"))
+
+        worker.conn.send(request)
+        loop.add_reader(fd, on_readable)
+        try:
+            return await result
+        finally:
+            loop.remove_reader(fd)
+            if grant and not grant.done():
+                grant.cancel()
+
+# Global instance
+ytdlp_pool = YtDlpProcessPool(config.YTDLP_CONCURRENCY)
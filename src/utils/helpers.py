@@ -1,17 +1,15 @@
 import os
 import random
+import asyncio
+import hashlib
 import aiofiles
 from pathlib import Path
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 from src.config import config
 from datetime import datetime
 def get_random_user_agent() -> str:
     return random.choice(config.USER_AGENTS)
 
-def get_random_proxy() -> str | None:
-    if not config.PROXY_LIST:
-        return None
-    return random.choice(config.PROXY_LIST)
-
 def sanitize_filename(filename: str) -> str:
     """Remove invalid characters from filename"""
     invalid_chars = '<>:"/\\|?*\x00-\x1f'
@@ -30,12 +28,54 @@ async def ensure_dir(path: str):
     Path(path).mkdir(parents=True, exist_ok=True)
 
 async def delete_file(filepath: str):
-    """Delete file safely"""
+    """Delete file safely, and its per-job directory once it's empty"""
     try:
         if os.path.exists(filepath):
             os.remove(filepath)
     except Exception:
         pass
+    
+    parent = os.path.dirname(os.path.abspath(filepath))
+    if os.path.dirname(parent) == os.path.abspath(config.DOWNLOAD_DIR):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            pass
+
+async def file_sha256(filepath: str) -> str:
+    """SHA-256 of file content (hashed in a thread)"""
+    def _hash():
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    return await asyncio.get_running_loop().run_in_executor(None, _hash)
+
+# Query params that don't change the content behind a URL
+TRACKING_PARAMS = {'si', 'feature', 'fbclid', 'gclid', 'igshid', 'ref', 'ref_src', 'pp'}
+
+def normalize_url(url: str) -> str:
+    """Canonical form of URL for cache keys"""
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    
+    path = parsed.path.rstrip('/') or '/'
+    query = [
+        (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith('utm_')
+    ]
+    
+    # youtu.be/<id> -> youtube.com/watch?v=<id>
+    if host == 'youtu.be' and path != '/':
+        query.append(('v', path.lstrip('/')))
+        host, path = 'youtube.com', '/watch'
+    
+    netloc = host if not parsed.port else f"{host}:{parsed.port}"
+    return urlunparse((parsed.scheme.lower() or 'https', netloc, path, '', urlencode(sorted(query)), ''))
 
 def format_bytes(size: int) -> str:
     """Format bytes to human readable"""
@@ -44,12 +84,3 @@ def format_bytes(size: int) -> str:
             return f"{size:.2f} {unit}"
         size /= 1024.0
     return f"{size:.2f} PB"
-
-def is_platform_url(url: str) -> bool:
-    """Check if URL is from supported platform"""
-    platforms = [
-        'youtube.com', 'youtu.be', 'spotify.com', 'deezer.com',
-        'soundcloud.com', 'pornhub.com', 'xvideos.com', 'xnxx.com'
-    ]
-    url_lower = url.lower()
-    return any(platform in url_lower for platform in platforms)
\ No newline at end of file
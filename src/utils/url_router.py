@@ -0,0 +1,109 @@
+import os
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+
+class Route(NamedTuple):
+    """How a URL is downloaded"""
+    engine: str  # 'platform', 'video', 'direct' or 'unknown'
+    platform: str | None  # Key of YtDlpService.PLATFORM_CONFIGS
+
+
+# Hosts (and their subdomains) handled by YtDlpService with a platform config
+PLATFORM_DOMAINS = {
+    'youtube.com': 'youtube',
+    'youtu.be': 'youtube',
+    'spotify.com': 'spotify',
+    'deezer.com': 'deezer',
+    'soundcloud.com': 'soundcloud',
+    'pornhub.com': 'pornhub',
+    'pornhub.org': 'pornhub',
+    'pornhub.net': 'pornhub',
+    'xvideos.com': 'xvideos',
+    'xnxx.com': 'xnxx',
+}
+
+# Other sites that need yt-dlp
+VIDEO_DOMAINS = [
+    'twitter.com', 'x.com',
+    'instagram.com',
+    'tiktok.com',
+    'reddit.com',
+    'vimeo.com',
+    'dailymotion.com',
+    'facebook.com', 'fb.watch',
+    'twitch.tv',
+    'streamable.com',
+]
+
+# Path extensions of direct file links
+DIRECT_EXTENSIONS = frozenset([
+    '.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.wmv',  # Video
+    '.mp3', '.m4a', '.wav', '.flac', '.ogg', '.aac',          # Audio
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp',         # Image
+    '.pdf', '.zip', '.rar', '.7z', '.tar', '.gz',             # Document
+])
+
+
+def host_of(url: str) -> str:
+    """Lowercase host without www., the key for per-site state"""
+    try:
+        host = (urlsplit(url.strip()).hostname or '').rstrip('.')
+    except ValueError:
+        return ''
+    return host[4:] if host.startswith('www.') else host
+
+
+class UrlRouter:
+    """
+    Classifies URLs by parsed host and path extension
+
+    Domains are stored in a trie keyed by reversed host labels
+    (com -> youtube), so a lookup walks at most one node per label of the
+    host and only matches whole labels: m.youtube.com matches youtube.com,
+    notyoutube.com and a youtube.com inside the query string don't.
+    """
+
+    def __init__(self):
+        self._trie: dict = {}
+        for domain, platform in PLATFORM_DOMAINS.items():
+            self._add(domain, Route('platform', platform))
+        for domain in VIDEO_DOMAINS:
+            self._add(domain, Route('video', None))
+
+        self._direct = Route('direct', None)
+        self._unknown = Route('unknown', None)
+
+    def _add(self, domain: str, route: Route):
+        node = self._trie
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        node[None] = route
+
+    def match_host(self, host: str) -> Route | None:
+        """Route of the longest registered domain suffix of `host`"""
+        node = self._trie
+        match = None
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
+
+    def route(self, url: str) -> Route:
+        try:
+            parsed = urlsplit(url.strip())
+        except ValueError:
+            return self._unknown
+
+        route = self.match_host((parsed.hostname or '').rstrip('.'))
+        if route:
+            return route
+
+        if os.path.splitext(parsed.path.lower())[1] in DIRECT_EXTENSIONS:
+            return self._direct
+        return self._unknown
+
+# Global instance
+url_router = UrlRouter()